@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+
+import argparse
+import csv
+import json
+import os
+import numpy as np
+from tabulate import tabulate
+from batch_valuation import get_valuations_batch
+from snapshots import iterate_snapshot_days
+from ticker_data import TickerTable
+from constants import *
+from utils import *
+
+def write_backtest_data(directory, tickers, dates, prices, fundamentals_dates, fundamentals):
+    """
+    Writes the history used by the backtest to the directory, as .npy files which are memory-mapped when read.
+    INPUT:
+        tickers: list of the tickers, the order of the columns of every array
+        dates: array of the trading days (datetime64[D]), the order of the rows of prices
+        prices: array of the closing price of every ticker on every trading day (days x tickers), nan when it was not traded
+        fundamentals_dates: array of the days (datetime64[D]) the fundamentals were known from, such as report dates, in increasing order
+        fundamentals: dictionary of field (see BACKTEST_FUNDAMENTAL_FIELDS) -> array (fundamentals_dates x tickers), nan when not known
+    Arrays can themselves be memory-mapped (see numpy.lib.format.open_memmap), to write histories larger than the memory.
+    """
+    os.makedirs(os.path.join(directory, 'fundamentals'), exist_ok = True)
+    with open(os.path.join(directory, 'tickers.json'), 'w') as tickers_file:
+        json.dump(list(tickers), tickers_file)
+    np.save(os.path.join(directory, 'dates.npy'), np.asarray(dates, dtype = 'datetime64[D]'))
+    np.save(os.path.join(directory, 'prices.npy'), np.asarray(prices, dtype = float))
+    np.save(os.path.join(directory, 'fundamentals_dates.npy'), np.asarray(fundamentals_dates, dtype = 'datetime64[D]'))
+    for field in BACKTEST_FUNDAMENTAL_FIELDS:
+        np.save(os.path.join(directory, 'fundamentals', field + '.npy'), np.asarray(fundamentals[field], dtype = float))
+
+def load_prices_csv(path):
+    """
+    Reads daily closing prices from a CSV file with the columns date (YYYY-MM-DD), ticker (as in the snapshots) and close,
+    one line per ticker and trading day, as exported from any price history.
+    OUTPUT:
+        (array of the trading days (datetime64[D]), dictionary of ticker -> array of its closing prices on these days, nan when not traded)
+    """
+    closes = {}
+    with open(path, newline = '') as prices_file:
+        for row in csv.DictReader(prices_file):
+            closes.setdefault(row['ticker'], {})[np.datetime64(row['date'], 'D')] = float(row['close'])
+    dates = np.array(sorted(set(date for ticker_closes in closes.values() for date in ticker_closes)), dtype = 'datetime64[D]')
+    return dates, {ticker: np.array([ticker_closes.get(date, np.nan) for date in dates]) for ticker, ticker_closes in closes.items()}
+
+def snapshots_to_backtest_data(directory = BACKTEST_DIRECTORY, snapshot_directory = SNAPSHOT_DIRECTORY, prices = None):
+    """
+    Converts the snapshot store written by main.py --snapshot (see snapshots.py) into the history of the backtest, see write_backtest_data.
+    Every day of the store is a fundamentals date, with the latest record of each ticker written on or before that day,
+    so a ticker not fetched every day keeps its previous fundamentals.
+    INPUT:
+        prices: the daily closing prices, as returned by load_prices_csv. By default, the current prices of the records are used,
+            with a day of the store as a trading day, so the rebalance and holding days are counted in days of the store.
+    OUTPUT:
+        (number of tickers, number of fundamentals dates)
+    """
+    fundamentals_dates, known_records, snapshot_prices = [], [], []
+    records = {}
+    for date, day_records in iterate_snapshot_days(snapshot_directory):
+        records = dict(records, **day_records)
+        fundamentals_dates.append(np.datetime64(date, 'D'))
+        known_records.append(records)
+        snapshot_prices.append({ticker: record['ticker_data'].get('current_price') for ticker, record in day_records.items()})
+    tickers = sorted(records)
+    #The fundamentals known on each day are laid out as a TickerTable, whose columns become the row of the day, nan where not known
+    fundamentals = {field: np.full((len(fundamentals_dates), len(tickers)), np.nan) for field in BACKTEST_FUNDAMENTAL_FIELDS}
+    for i, day_records in enumerate(known_records):
+        table = TickerTable()
+        for ticker in tickers:
+            table.append(ticker, day_records[ticker]['ticker_data'] if ticker in day_records else {})
+        for field, values in fundamentals.items():
+            values[i] = table.column(field)
+    if prices is None:
+        dates = fundamentals_dates
+        prices_array = np.full((len(dates), len(tickers)), np.nan)
+        for i, day_prices in enumerate(snapshot_prices):
+            for j, ticker in enumerate(tickers):
+                if day_prices.get(ticker) is not None:
+                    prices_array[i, j] = day_prices[ticker]
+    else:
+        dates, closes = prices
+        prices_array = np.full((len(dates), len(tickers)), np.nan)
+        for j, ticker in enumerate(tickers):
+            if ticker in closes:
+                prices_array[:, j] = closes[ticker]
+    write_backtest_data(directory, tickers, dates, prices_array, fundamentals_dates, fundamentals)
+    return len(tickers), len(fundamentals_dates)
+
+def load_backtest_data(directory = BACKTEST_DIRECTORY):
+    """
+    Opens the history written by write_backtest_data. The prices and fundamentals are memory-mapped, so only the rows
+    of the dates being valued are read from the disk.
+    FORMAT:
+    {tickers, dates, prices, fundamentals_dates, fundamentals: {field: array}}
+    """
+    with open(os.path.join(directory, 'tickers.json')) as tickers_file:
+        tickers = json.load(tickers_file)
+    return {
+        'tickers': tickers,
+        'dates': np.load(os.path.join(directory, 'dates.npy')),
+        'prices': np.load(os.path.join(directory, 'prices.npy'), mmap_mode = 'r'),
+        'fundamentals_dates': np.load(os.path.join(directory, 'fundamentals_dates.npy')),
+        'fundamentals': {field: np.load(os.path.join(directory, 'fundamentals', field + '.npy'), mmap_mode = 'r') for field in BACKTEST_FUNDAMENTAL_FIELDS},
+    }
+
+def get_rebalance_indices(num_days, rebalance_days = BACKTEST_REBALANCE_DAYS, holding_days = BACKTEST_HOLDING_DAYS):
+    """
+    Returns the indices of the trading days to rebalance on, every rebalance_days, leaving holding_days after the last one
+    """
+    return np.arange(0, num_days - holding_days, rebalance_days)
+
+def backtest_chunk(data, day_indices, holding_days = BACKTEST_HOLDING_DAYS, **assumptions):
+    """
+    Values the whole universe at each of the given trading days at once, with the fundamentals known on that day,
+    and returns the rows (see backtest) of the portfolios bought on these days.
+    """
+    #The fundamentals known on a day are the latest ones from before or on that day, so nothing is known ahead of time
+    fundamentals_indices = np.searchsorted(data['fundamentals_dates'], data['dates'][day_indices], side = 'right') - 1
+    known = fundamentals_indices >= 0
+    day_indices, fundamentals_indices = day_indices[known], fundamentals_indices[known]
+    columns = {field: np.asarray(values[fundamentals_indices]) for field, values in data['fundamentals'].items()}
+    with np.errstate(all = 'ignore'):
+        valuations = get_valuations_batch(columns, **assumptions)
+        buy_prices = np.asarray(data['prices'][day_indices])
+        forward_returns = np.asarray(data['prices'][day_indices + holding_days]) / buy_prices - 1
+    traded = np.isfinite(forward_returns)
+    rows = []
+    for i, day_index in enumerate(day_indices):
+        universe_return = forward_returns[i][traded[i]].mean() if traded[i].any() else np.nan
+        for valuation_name in VALUATION_NAMES:
+            valuation = valuations[valuation_name][i]
+            holdings = traded[i] & (valuation > 0) & (buy_prices[i] < valuation)
+            portfolio_return = forward_returns[i][holdings].mean() if holdings.any() else np.nan
+            rows.append([data['dates'][day_index], valuation_name, int(holdings.sum()), portfolio_return, universe_return])
+    return rows
+
+def backtest(data, rebalance_days = BACKTEST_REBALANCE_DAYS, holding_days = BACKTEST_HOLDING_DAYS, chunk_dates = BACKTEST_CHUNK_DATES, **assumptions):
+    """
+    Backtests buying, at every rebalance date, the tickers whose price is below their valuation, for each of the valuation models.
+    Each portfolio is equally weighted, and held for holding_days trading days. The rebalance dates are valued chunk_dates at a time,
+    so the memory used does not grow with the length of the history.
+    INPUT:
+        data: the history, see load_backtest_data
+        assumptions: passed on to the valuation models, see batch_valuation.get_valuations_batch
+    OUTPUT:
+        List of rows [rebalance date, valuation name, number of holdings, forward return of the portfolio, forward return of the universe],
+        returns as fractions, nan when there is nothing to hold
+    """
+    day_indices = get_rebalance_indices(len(data['dates']), rebalance_days, holding_days)
+    rows = []
+    for start in range(0, len(day_indices), chunk_dates):
+        rows.extend(backtest_chunk(data, day_indices[start:start + chunk_dates], holding_days, **assumptions))
+    return rows
+
+def summarize(rows):
+    """
+    Summarizes the rows of backtest for each valuation model.
+    FORMAT:
+    [valuation name, rebalance dates, average holdings, average portfolio return %, average universe return %, % of dates beating the universe]
+    """
+    summary = []
+    for valuation_name in VALUATION_NAMES:
+        held = [row for row in rows if row[1] == valuation_name and not np.isnan(row[3])]
+        if not held:
+            summary.append([valuation_name, 0, 0, None, None, None])
+            continue
+        summary.append([valuation_name, len(held), round_values(np.mean([row[2] for row in held])),
+            round_values(np.mean([row[3] for row in held]) * 100), round_values(np.mean([row[4] for row in held]) * 100),
+            round_values(np.mean([row[3] > row[4] for row in held]) * 100)])
+    return summary
+
+if __name__ == '__main__':
+    args = argparse.ArgumentParser()
+    args.add_argument('--directory', default = BACKTEST_DIRECTORY, help = 'Directory of the history, see write_backtest_data')
+    args.add_argument('--rebalance-days', type = int, default = BACKTEST_REBALANCE_DAYS, help = 'Trading days between two rebalance dates')
+    args.add_argument('--holding-days', type = int, default = BACKTEST_HOLDING_DAYS, help = 'Trading days each portfolio is held for')
+    args.add_argument('--details', action = 'store_true', help = 'Also print the portfolio of every rebalance date')
+    args.add_argument('--from-snapshots', action = 'store_true', help = 'First convert the snapshot store (see main.py --snapshot) into the history in --directory')
+    args.add_argument('--prices-file', help = 'With --from-snapshots, CSV file of the daily closing prices (date,ticker,close), see load_prices_csv, '
+        'instead of the prices of the snapshots')
+    namespace, extra_params = args.parse_known_args()
+
+    if namespace.from_snapshots:
+        num_tickers, num_dates = snapshots_to_backtest_data(namespace.directory, prices = load_prices_csv(namespace.prices_file) if namespace.prices_file else None)
+        print ("Converted the snapshots of %d tickers over %d days into %s" % (num_tickers, num_dates, namespace.directory))
+        print ()
+
+    rows = backtest(load_backtest_data(namespace.directory), namespace.rebalance_days, namespace.holding_days)
+    if namespace.details:
+        print (tabulate([[str(date), VALUATION_HEADERS[name], holdings, round_values(portfolio_return * 100), round_values(universe_return * 100)]
+            for date, name, holdings, portfolio_return, universe_return in rows],
+            headers = ['Date', VALUATION, 'Holdings', 'Return %', 'Universe return %']))
+        print ()
+    print (tabulate([[VALUATION_HEADERS[row[0]]] + row[1:] for row in summarize(rows)],
+        headers = [VALUATION, 'Dates', 'Average holdings', 'Average return %', 'Average universe return %', 'Beat universe %']))
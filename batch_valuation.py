@@ -0,0 +1,118 @@
+import numpy as np
+from constants import *
+from profiler import profiled
+
+@profiled('valuation.price_earnings_batch')
+def price_earnings_batch(earnings_per_share_ttm, historical_price_earnings_ratio, expected_growth_rate_per_annum_in_percentage, num_years_forecast,
+        discount_rate_in_percentage = HISTORIC_MARKET_DISCOUNT_RATE):
+    """
+    Batch version of valuation_methods.price_earnings. Every input (except num_years_forecast) is an array with one value per ticker,
+    or a scalar shared by all of them, and the output is the array of net present values per share. Inputs are broadcast against each other,
+    so the assumptions such as discount_rate_in_percentage can also be arrays, for example to value one ticker under many assumptions. Results match the scalar function, up to the last bit of the power
+    function, as numpy may use a vectorized power instead of the C library's.
+    """
+    earnings_per_share_ttm, historical_price_earnings_ratio, expected_growth_rate_per_annum_in_percentage, discount_rate_in_percentage = _as_arrays(
+        earnings_per_share_ttm, historical_price_earnings_ratio, expected_growth_rate_per_annum_in_percentage, discount_rate_in_percentage)
+    predicted_growth = (1 + expected_growth_rate_per_annum_in_percentage / 100) ** num_years_forecast
+    future_predicted_price = earnings_per_share_ttm * historical_price_earnings_ratio * predicted_growth
+    return future_predicted_price / ((1 + discount_rate_in_percentage / 100) ** num_years_forecast)
+
+@profiled('valuation.discounted_cash_flow_batch')
+def discounted_cash_flow_batch(cash_and_cash_equivalents, total_debt, free_cash_flow, shares_outstanding, expected_growth_rate_per_annum_in_percentage, num_years_forecast,
+        discount_rate_in_percentage = HISTORIC_MARKET_DISCOUNT_RATE, growth_decline_percentage = GROWTH_DECLINE_PERCENTAGE, fcf_multiplier = FCF_MULTIPLIER_YEAR_10):
+    """
+    Batch version of valuation_methods.discounted_cash_flow, see price_earnings_batch for the inputs.
+    The loop over years is replaced by (tickers x years) arrays: the declining growth rate of every year is the cumulative product
+    of the first year's rate with the decline factor, the free cash flow of every year is the cumulative product of the growth multipliers,
+    and their net present values are summed in year order, so the floating point operations are the same as the scalar function's.
+    """
+    (cash_and_cash_equivalents, total_debt, free_cash_flow, shares_outstanding, expected_growth_rate_per_annum_in_percentage,
+        discount_rate_in_percentage, growth_decline_percentage, fcf_multiplier) = _as_arrays(
+        cash_and_cash_equivalents, total_debt, free_cash_flow, shares_outstanding, expected_growth_rate_per_annum_in_percentage,
+        discount_rate_in_percentage, growth_decline_percentage, fcf_multiplier)
+    growth_rates = _cumulative_product(expected_growth_rate_per_annum_in_percentage, 1 - growth_decline_percentage / 100, num_years_forecast - 1, include_first = True)
+    free_cash_flows = _cumulative_product(free_cash_flow, 1 + growth_rates / 100)
+    npv_free_cash_flows = free_cash_flows / _discount_factors(discount_rate_in_percentage, 1, num_years_forecast)
+    total_npv_fcf = np.cumsum(npv_free_cash_flows, axis = -1)[..., -1]
+    fcf_value_year_10 = npv_free_cash_flows[..., -1] * fcf_multiplier
+    company_value = total_npv_fcf + fcf_value_year_10 + cash_and_cash_equivalents - total_debt
+    return company_value / shares_outstanding
+
+@profiled('valuation.roe_valuation_batch')
+def roe_valuation_batch(total_shareholders_equity, roe_average_5_years, shares_outstanding, trailing_annual_dividend_rate, expected_growth_rate_per_annum_in_percentage, num_years_forecast,
+        discount_rate_in_percentage = HISTORIC_MARKET_DISCOUNT_RATE):
+    """
+    Batch version of valuation_methods.roe_valuation, see price_earnings_batch for the inputs.
+    The equity per share and the dividend of every year are cumulative products of the growth multiplier, and the net present values
+    of the dividends are summed in year order, as in the scalar function.
+    """
+    (total_shareholders_equity, roe_average_5_years, shares_outstanding, trailing_annual_dividend_rate, expected_growth_rate_per_annum_in_percentage,
+        discount_rate_in_percentage) = _as_arrays(
+        total_shareholders_equity, roe_average_5_years, shares_outstanding, trailing_annual_dividend_rate, expected_growth_rate_per_annum_in_percentage,
+        discount_rate_in_percentage)
+    growth_multiplier = 1 + expected_growth_rate_per_annum_in_percentage / 100
+    shareholders_equity_per_share = _cumulative_product(total_shareholders_equity / shares_outstanding, growth_multiplier, num_years_forecast)[..., -1]
+    dividends = _cumulative_product(trailing_annual_dividend_rate, growth_multiplier, num_years_forecast)
+    #As in the scalar function, the dividend of the first year is not discounted
+    total_npv_dividend = np.cumsum(dividends / _discount_factors(discount_rate_in_percentage, 0, num_years_forecast - 1), axis = -1)[..., -1]
+    net_income_last_year = shareholders_equity_per_share * roe_average_5_years / 100
+    required_value = net_income_last_year / (discount_rate_in_percentage / 100)
+    npv_required_value = required_value / ((1 + discount_rate_in_percentage / 100) ** 10)
+    return npv_required_value + total_npv_dividend
+
+def get_valuations_batch(columns, discount_rate_in_percentage = HISTORIC_MARKET_DISCOUNT_RATE, growth_decline_percentage = GROWTH_DECLINE_PERCENTAGE,
+        fcf_multiplier = FCF_MULTIPLIER_YEAR_10):
+    """
+    Batch version of main.get_valuations. Takes a dictionary of ticker_data field -> array of values (one per ticker), as returned by
+    ticker_data_to_columns, and returns a dictionary of valuation name -> array of valuations.
+    The assumptions are passed on to the valuation models, see discounted_cash_flow_batch.
+    """
+    return {
+        'price_earnings_valuation': price_earnings_batch(columns['earnings_per_share_ttm'],
+            columns['historical_price_earnings_ratio_5_years'],
+            columns['conservative_growth_rate'],
+            5,
+            discount_rate_in_percentage),
+        'discounted_cash_flow_valuation': discounted_cash_flow_batch(columns['cash_and_cash_equivalents'],
+            columns['total_debt'],
+            columns['free_cash_flow_ttm'],
+            columns['shares_outstanding'],
+            columns['conservative_growth_rate'],
+            10,
+            discount_rate_in_percentage,
+            growth_decline_percentage,
+            fcf_multiplier),
+        'roe_valuation': roe_valuation_batch(columns['total_shareholders_equity'],
+            columns['roe_average_5_years'],
+            columns['shares_outstanding'],
+            columns['trailing_annual_dividend_rate'],
+            columns['conservative_growth_rate'],
+            10,
+            discount_rate_in_percentage)
+    }
+
+def ticker_data_to_columns(ticker_data_list):
+    """
+    Converts a list of ticker_data dictionaries into a dictionary of field -> array of values, one per ticker. Missing fields are nan.
+    """
+    fields = set()
+    for ticker_data in ticker_data_list:
+        fields.update(ticker_data.keys())
+    return {field: np.array([ticker_data.get(field, np.nan) for ticker_data in ticker_data_list], dtype = float) for field in fields}
+
+def _as_arrays(*values):
+    return np.broadcast_arrays(*[np.asarray(value, dtype = float) for value in values])
+
+def _cumulative_product(first, factors, num_years = None, include_first = False):
+    """
+    Returns the array of first * factors[0] * factors[1] * ..., one column per year, multiplied in year order.
+    factors is either one column per year, or a single value per ticker repeated for num_years.
+    """
+    if num_years is not None:
+        factors = np.repeat(np.asarray(factors)[..., np.newaxis], num_years, axis = -1)
+    steps = np.concatenate([np.asarray(first)[..., np.newaxis], factors], axis = -1)
+    products = np.cumprod(steps, axis = -1)
+    return products if include_first else products[..., 1:]
+
+def _discount_factors(discount_rate_in_percentage, first_year, last_year):
+    return (1 + discount_rate_in_percentage[..., np.newaxis] / 100) ** np.arange(first_year, last_year + 1)
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+"""
+Runs main.py and dividends.py end to end against a local stand-in server serving recorded responses (see replay.py), without the network.
+Reports the tickers per second, the p50/p99 latency per ticker, and the number of requests to each source, so that changes to fetching
+and parsing can be checked for regressions.
+"""
+
+import argparse
+import math
+import os
+import shutil
+import tempfile
+import threading
+import time
+from tabulate import tabulate
+import dividends
+import fetch_tickers
+import main
+from cache import configure_cache
+from constants import *
+from rate_limiter import configure_rate_limit
+from replay import StandInServer, clone_recording
+from sources import configure_sources
+
+def percentile(values, percent):
+    """
+    Returns the given percentile of the values, by the nearest rank
+    """
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+def measure(name, run, my_tickers, latencies, stand_in):
+    """
+    Runs the command for the tickers, and returns its row of the report. latencies is filled by the command with ticker -> seconds.
+    """
+    latencies.clear()
+    request_counts = stand_in.request_counts.copy()
+    start = time.perf_counter()
+    rows = run(my_tickers)
+    elapsed = time.perf_counter() - start
+    requests = stand_in.request_counts - request_counts
+    ticker_latencies = list(latencies.values()) or [0]
+    return [name, len(my_tickers), len(rows), round(elapsed, 2), round(len(my_tickers) / elapsed, 1),
+        round(percentile(ticker_latencies, 50) * 1000, 1), round(percentile(ticker_latencies, 99) * 1000, 1),
+        requests[YAHOO], requests[MORNINGSTAR]]
+
+def track_fetcher_latencies(latencies):
+    """
+    Wraps every fetcher of fetch_tickers, so that the latency of a ticker is the time from the start of its first request
+    to the end of its last one
+    """
+    spans = {}
+    lock = threading.Lock()
+    def wrap(fetcher):
+        def timed_fetcher(ticker, ticker_data):
+            start = time.perf_counter()
+            fetcher(ticker, ticker_data)
+            end = time.perf_counter()
+            with lock:
+                first_start, _ = spans.get(ticker, (start, end))
+                spans[ticker] = (min(first_start, start), end)
+                latencies[ticker] = spans[ticker][1] - spans[ticker][0]
+        return timed_fetcher
+    fetch_tickers.TICKER_DATA_FETCHERS = {endpoint: wrap(fetcher) for endpoint, fetcher in fetch_tickers.TICKER_DATA_FETCHERS.items()}
+
+def track_dividend_latencies(latencies):
+    fetch_next_dividend = dividends.fetch_next_dividend
+    def timed_fetch_next_dividend(ticker):
+        start = time.perf_counter()
+        try:
+            return fetch_next_dividend(ticker)
+        finally:
+            latencies[ticker] = time.perf_counter() - start
+    dividends.fetch_next_dividend = timed_fetch_next_dividend
+
+if __name__ == '__main__':
+    args = argparse.ArgumentParser()
+    args.add_argument('--directory', default = os.path.join('fixtures', 'recordings'), help = 'Directory of the recorded responses')
+    args.add_argument('--template', default = 'AAPL', help = 'Recorded ticker copied to make up the --tickers')
+    args.add_argument('--tickers', type = int, default = 100, help = 'Number of tickers to run, copies of the --template ticker')
+    args.add_argument('--latency', type = float, default = 0.05, help = 'Seconds the stand-in server waits before every response')
+    args.add_argument('--error-rate', type = float, default = 0, help = 'Fraction of requests the stand-in server answers with 503')
+    args.add_argument('--requests-per-second', type = float, help = 'Rate limit of each source, instead of RATE_LIMITS_PER_HOST')
+    namespace, extra_params = args.parse_known_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        recordings = os.path.join(directory, 'recordings')
+        shutil.copytree(namespace.directory, recordings)
+        my_tickers = ['%s%04d' % (namespace.template, i) for i in range(namespace.tickers)]
+        clone_recording(recordings, namespace.template, my_tickers)
+
+        stand_in = StandInServer(recordings, namespace.latency, namespace.error_rate).start()
+        configure_cache(enabled = False)
+        configure_sources(replay_url = stand_in.url)
+        if namespace.requests_per_second:
+            for host in SOURCE_HOSTS.values():
+                configure_rate_limit(host, namespace.requests_per_second, namespace.requests_per_second)
+
+        latencies = {}
+        track_fetcher_latencies(latencies)
+        track_dividend_latencies(latencies)
+        results = [
+            measure('main.py', main.get_valuation_table, my_tickers, latencies, stand_in),
+            measure('dividends.py', dividends.get_dividend_table, my_tickers, latencies, stand_in),
+        ]
+        stand_in.stop()
+    print (tabulate(results, headers = ['Command', 'Tickers', 'Rows', 'Seconds', 'Tickers/s', 'p50 latency (ms)', 'p99 latency (ms)',
+        'Yahoo requests', 'Morningstar requests']))
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+"""
+Benchmarks the cold start of the commands, each in fresh python processes: importing the modules, and running main.py and dividends.py
+for a ticker whose responses are all in the cache (copied from fixtures/recordings), so nothing is fetched.
+Reports the median wall time, the time spent importing (from python -X importtime), and which of the heavy dependencies were imported.
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from tabulate import tabulate
+from cache import configure_cache, set_cached
+from constants import *
+from sources import SOURCE_ENDPOINTS, load_recording
+
+PACKAGE_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+RECORDINGS_DIRECTORY = os.path.join(PACKAGE_DIRECTORY, 'fixtures', 'recordings')
+HEAVY_MODULES = ['yahoo_fin', 'pandas', 'requests', 'bs4', 'lxml', 'pyarrow', 'numpy', 'tabulate']
+
+#name -> arguments of python running it
+COMMANDS = {
+    'import valuation_methods': ['-c', 'import valuation_methods'],
+    'import main': ['-c', 'import main'],
+    'main.py --help': [os.path.join(PACKAGE_DIRECTORY, 'main.py'), '--help'],
+    'main.py (cache hit)': [os.path.join(PACKAGE_DIRECTORY, 'main.py'), '--ticker=AAPL'],
+    'dividends.py (cache hit)': [os.path.join(PACKAGE_DIRECTORY, 'dividends.py'), '--ticker=AAPL'],
+}
+
+def fill_cache(path, ticker = 'AAPL'):
+    """
+    Caches every recorded response of the ticker in the cache at path, so the commands run for it without fetching anything
+    """
+    configure_cache(path = path)
+    for source, endpoint in SOURCE_ENDPOINTS:
+        set_cached(source, endpoint, ticker, load_recording(RECORDINGS_DIRECTORY, source, endpoint, ticker))
+    configure_cache()
+
+def measure(arguments, directory):
+    """
+    Runs python with the arguments in the directory, and returns (wall seconds, seconds importing, set of top level modules imported)
+    """
+    environment = dict(os.environ, PYTHONPATH = PACKAGE_DIRECTORY)
+    start = time.perf_counter()
+    completed = subprocess.run([sys.executable, '-X', 'importtime'] + arguments, cwd = directory, env = environment,
+        stdout = subprocess.DEVNULL, stderr = subprocess.PIPE, text = True, check = True)
+    elapsed = time.perf_counter() - start
+    import_microseconds = 0
+    modules = set()
+    for line in completed.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_microseconds, _, module = line[len('import time:'):].split('|')
+        import_microseconds += int(self_microseconds)
+        modules.add(module.strip().split('.')[0])
+    return elapsed, import_microseconds / 10**6, modules
+
+if __name__ == '__main__':
+    args = argparse.ArgumentParser()
+    args.add_argument('--repeat', type = int, default = 5, help = 'Number of runs of every command, the median is reported')
+    namespace, extra_params = args.parse_known_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        fill_cache(os.path.join(directory, CACHE_FILE))
+        for name, arguments in COMMANDS.items():
+            runs = [measure(arguments, directory) for _ in range(namespace.repeat)]
+            heavy_modules = [module for module in HEAVY_MODULES if module in runs[-1][2]]
+            results.append([name, round(statistics.median(run[0] for run in runs) * 1000), round(statistics.median(run[1] for run in runs) * 1000),
+                ', '.join(heavy_modules) or '-'])
+    print (tabulate(results, headers = ['Command', 'Wall time (ms)', 'Import time (ms)', 'Heavy modules imported']))
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+"""
+Benchmarks parsing the saved Morningstar pages in fixtures/morningstar with the extractors, against the previous approach of building
+a full BeautifulSoup tree and scanning it with a lambda (needs beautifulsoup4 installed).
+Reports the time per page, and the memory a fresh process holds after parsing the page once, keeping the parse result alive
+(resident memory, so it counts both python objects and the memory of libxml2 used by lxml; needs Linux).
+"""
+
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import timeit
+from tabulate import tabulate
+from extractors import extract_rows, extract_attribute_by_id
+
+FIXTURES_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'morningstar')
+
+def _soup_rows(content, label):
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(content, 'lxml')
+    tag = soup.find(lambda tag:tag.name == 'th' and label in tag.text)
+    return soup, [cell.text for cell in tag.parent.find_all('td')]
+
+def _soup_attribute(content, parent_id, child_id, attribute):
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(content, 'lxml')
+    return soup, soup.find(id = parent_id).find(id = child_id)[attribute]
+
+#page -> (previous approach, extractor), each taking the page content
+PARSERS = {
+    'current_valuation': (lambda content: _soup_rows(content, 'Price/Earnings'), lambda content: extract_rows(content, ['Price/Earnings'])),
+    'finance_part': (lambda content: _soup_rows(content, 'Free Cash Flow'), lambda content: extract_rows(content, ['Free Cash Flow'])),
+    'balance_sheet_report': (lambda content: _soup_attribute(content, 'data_i1', 'Y_5', 'rawvalue'),
+        lambda content: extract_attribute_by_id(content, 'data_i1', 'Y_5', 'rawvalue')),
+    'key_stats': (lambda content: _soup_rows(content, 'Return on Equity %'), lambda content: extract_rows(content, ['Return on Equity %'])),
+}
+
+def read_page(page):
+    with open(os.path.join(FIXTURES_DIRECTORY, page + '.html'), encoding = 'utf-8') as page_file:
+        return page_file.read()
+
+def measure_memory(page, approach):
+    """
+    Returns the growth in KB of the resident memory of a process parsing the page once, keeping the parse result alive
+    """
+    output = subprocess.run([sys.executable, __file__, '--memory', page, approach], capture_output = True, text = True, check = True)
+    return int(output.stdout)
+
+def _print_memory(page, approach):
+    import bs4 #Imported before measuring, so that only the parsing counts
+    content = read_page(page)
+    #Parse a tiny page first, so the parsers are initialized before measuring
+    try:
+        PARSERS[page][0 if approach == 'soup' else 1]('<table><tr><th></th></tr></table>')
+    except:
+        pass
+    before = _resident_memory()
+    result = PARSERS[page][0 if approach == 'soup' else 1](content)
+    print (_resident_memory() - before)
+
+def _resident_memory():
+    with open('/proc/self/statm') as statm:
+        return int(statm.read().split()[1]) * resource.getpagesize() // 1024
+
+if __name__ == '__main__':
+    args = argparse.ArgumentParser()
+    args.add_argument('--repeat', type = int, default = 50, help = 'Number of times each page is parsed for timing')
+    args.add_argument('--memory', nargs = 2, help = argparse.SUPPRESS)
+    namespace = args.parse_args()
+    if namespace.memory:
+        _print_memory(*namespace.memory)
+        sys.exit()
+
+    results = []
+    for page, (soup_parser, extractor) in PARSERS.items():
+        content = read_page(page)
+        soup_time = timeit.timeit(lambda: soup_parser(content), number = namespace.repeat) / namespace.repeat
+        extractor_time = timeit.timeit(lambda: extractor(content), number = namespace.repeat) / namespace.repeat
+        results.append([page, len(content) // 1024, round(soup_time * 1000, 3), round(extractor_time * 1000, 3), round(soup_time / extractor_time, 1),
+            measure_memory(page, 'soup'), measure_memory(page, 'extractor')])
+    print (tabulate(results, headers = ['Page', 'Size (KB)', 'Soup (ms)', 'Extractor (ms)', 'Speedup', 'Soup memory (KB)', 'Extractor memory (KB)']))
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+"""
+Benchmarks keeping the ticker_data of many tickers in memory, as dictionaries (with utils.validate_values), as TickerData records,
+and as a TickerTable. Reports the memory per ticker (measured with tracemalloc, without the float values shared by all the layouts), and the time to build,
+validate, and get the columns of all of them for batch_valuation.get_valuations_batch.
+"""
+
+import argparse
+import random
+import time
+import tracemalloc
+from tabulate import tabulate
+from batch_valuation import ticker_data_to_columns
+from constants import *
+from ticker_data import TickerData, TickerTable
+from utils import *
+
+def build_dictionaries(rows):
+    return [dict(zip(TICKER_DATA_FIELDS, row)) for row in rows]
+
+def validate_dictionaries(ticker_data_list):
+    for ticker_data in ticker_data_list:
+        validate_values(ticker_data)
+
+def build_records(rows):
+    return [TickerData(zip(TICKER_DATA_FIELDS, row)) for row in rows]
+
+def validate_records(ticker_data_list):
+    for ticker_data in ticker_data_list:
+        ticker_data.validate()
+
+def build_table(rows):
+    table = TickerTable()
+    for i, row in enumerate(rows):
+        table.append(str(i), dict(zip(TICKER_DATA_FIELDS, row)))
+    return table
+
+#name -> (function building all the tickers from the rows of values, function validating them, function returning their columns)
+LAYOUTS = {
+    'dict': (build_dictionaries, validate_dictionaries, ticker_data_to_columns),
+    'TickerData': (build_records, validate_records, ticker_data_to_columns),
+    'TickerTable': (build_table, TickerTable.validate, TickerTable.columns),
+}
+
+def measure(build, validate, to_columns, rows):
+    """
+    Returns the row of the report of the layout: bytes allocated per ticker, and the milliseconds to build, validate,
+    and get the columns for batch_valuation.get_valuations_batch
+    """
+    tracemalloc.start()
+    built = build(rows)
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del built
+    timings = []
+    start = time.perf_counter()
+    built = build(rows)
+    for step in [validate, to_columns]:
+        timings.append((time.perf_counter() - start) * 1000)
+        start = time.perf_counter()
+        step(built)
+    timings.append((time.perf_counter() - start) * 1000)
+    return [round(allocated / len(rows))] + [round(timing, 1) for timing in timings]
+
+if __name__ == '__main__':
+    args = argparse.ArgumentParser()
+    args.add_argument('--tickers', type = int, default = 50000, help = 'Number of tickers to build')
+    namespace, extra_params = args.parse_known_args()
+
+    rng = random.Random(0)
+    #The values are created once and shared, so only the memory of the layouts themselves is compared
+    rows = [[rng.uniform(1, 100) for _ in TICKER_DATA_FIELDS] for _ in range(namespace.tickers)]
+    results = []
+    for name, (build, validate, to_columns) in LAYOUTS.items():
+        results.append([name] + measure(build, validate, to_columns, rows))
+    print (tabulate(results, headers = ['Layout', 'Bytes per ticker', 'Build (ms)', 'Validate (ms)', 'Columns (ms)']))
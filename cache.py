@@ -0,0 +1,106 @@
+import datetime
+import json
+import sqlite3
+import threading
+import time
+from constants import *
+
+_settings = {'enabled': True, 'refresh': False, 'path': CACHE_FILE}
+_connection = None
+_lock = threading.Lock()
+
+def configure_cache(enabled = True, refresh = False, path = CACHE_FILE):
+    """
+    Configures the cache for this run.
+    INPUT:
+        enabled: If False, nothing is read from or written to the cache (--no-cache)
+        refresh: If True, cached values are ignored, but the fetched values are still written to the cache (--refresh)
+        path: The SQLite file to keep the cache in
+    """
+    global _connection
+    with _lock:
+        if _connection is not None and path != _settings['path']:
+            _connection.close()
+            _connection = None
+        _settings.update({'enabled': enabled, 'refresh': refresh, 'path': path})
+
+def get_cached(source, endpoint, ticker, fetch):
+    """
+    Returns the cached response for (source, endpoint, ticker) if it is still fresh, otherwise calls fetch() and caches its result.
+    The response must be json serializable. If fetch raises an exception, nothing is cached.
+    """
+    if not _settings['enabled']:
+        return fetch()
+    if not _settings['refresh']:
+        with _lock:
+            row = _get_connection().execute('SELECT value FROM responses WHERE source = ? AND endpoint = ? AND ticker = ? AND expires_at > ?',
+                (source, endpoint, ticker, time.time())).fetchone()
+        if row is not None:
+            return json.loads(row[0])
+    value = fetch()
+    set_cached(source, endpoint, ticker, value)
+    return value
+
+def get_fresh(source, endpoint, tickers):
+    """
+    Returns {ticker: cached response} for those of the given tickers whose response for (source, endpoint) is still fresh, in a single query
+    """
+    if not _settings['enabled'] or _settings['refresh'] or not tickers:
+        return {}
+    with _lock:
+        rows = _get_connection().execute('SELECT ticker, value FROM responses WHERE source = ? AND endpoint = ? AND expires_at > ? AND ticker IN (%s)'
+            % ', '.join('?' * len(tickers)), [source, endpoint, time.time()] + list(tickers)).fetchall()
+    return {ticker: json.loads(value) for ticker, value in rows}
+
+def set_cached(source, endpoint, ticker, value):
+    """
+    Caches the response for (source, endpoint, ticker), as if it was fetched by get_cached
+    """
+    if not _settings['enabled']:
+        return
+    with _lock:
+        _get_connection().execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)',
+            (source, endpoint, ticker, json.dumps(value), expiry_time(endpoint, time.time())))
+        _get_connection().commit()
+
+def get_validators(url):
+    """
+    Returns (etag, last_modified, content) of the last response of the given url, for conditional requests, or None if it is not known
+    """
+    if not _settings['enabled']:
+        return None
+    with _lock:
+        return _get_connection().execute('SELECT etag, last_modified, content FROM validators WHERE url = ?', (url,)).fetchone()
+
+def set_validators(url, etag, last_modified, content):
+    """
+    Stores the ETag and Last-Modified headers of the response of the given url, with its content to reuse if it is not modified
+    """
+    if not _settings['enabled']:
+        return
+    with _lock:
+        _get_connection().execute('INSERT OR REPLACE INTO validators VALUES (?, ?, ?, ?)', (url, etag, last_modified, content))
+        _get_connection().commit()
+
+def expiry_time(endpoint, now):
+    """
+    Returns the time (in seconds since epoch) at which a response of the given endpoint fetched at time now expires, as per CACHE_TTL_SECONDS
+    """
+    ttl = CACHE_TTL_SECONDS.get(endpoint, 0)
+    if ttl == UNTIL_NEXT_QUARTER:
+        today = datetime.date.fromtimestamp(now)
+        next_quarter_month = (today.month - 1) // 3 * 3 + 4
+        if next_quarter_month > 12:
+            next_quarter_start = datetime.datetime(today.year + 1, 1, 1)
+        else:
+            next_quarter_start = datetime.datetime(today.year, next_quarter_month, 1)
+        return next_quarter_start.timestamp()
+    return now + ttl
+
+def _get_connection():
+    global _connection
+    if _connection is None:
+        _connection = sqlite3.connect(_settings['path'], check_same_thread = False)
+        _connection.execute('CREATE TABLE IF NOT EXISTS responses (source TEXT, endpoint TEXT, ticker TEXT, value TEXT, expires_at REAL, PRIMARY KEY (source, endpoint, ticker))')
+        _connection.execute('CREATE TABLE IF NOT EXISTS validators (url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, content TEXT)')
+    return _connection
@@ -0,0 +1,41 @@
+from cache import configure_cache
+from profiler import configure_profile, profile_table, write_profile, PROFILE_HEADERS
+from sources import configure_sources
+
+def add_run_arguments(args, refresh = True, profile = True):
+    """
+    Adds the arguments choosing where the responses come from (--no-cache, --refresh, --replay) and the profile arguments
+    (--profile, --profile-output) to the given argparse.ArgumentParser, so that every script names and applies them the same way.
+    INPUT:
+        refresh, profile: False for the scripts without --refresh, or without the profile arguments. They are then always off.
+    """
+    args.add_argument('--no-cache', action = 'store_true', help = 'Do not read or write the cache, fetch everything from the sources')
+    if refresh:
+        args.add_argument('--refresh', action = 'store_true', help = 'Ignore the cached responses, fetch everything and update the cache')
+    else:
+        args.set_defaults(refresh = False)
+    args.add_argument('--replay', help = 'Fetch the responses from the stand-in server at this url (see replay.py), without the cache')
+    if profile:
+        args.add_argument('--profile', action = 'store_true', help = 'Print the time, bytes downloaded, cache hits and failures of every stage')
+        args.add_argument('--profile-output', help = 'Write the profile to this file, as json if it ends with .json, otherwise in the Prometheus text format')
+    else:
+        args.set_defaults(profile = False, profile_output = None)
+
+def configure_run(namespace):
+    """
+    Configures the cache, the sources and the profiler from the arguments added by add_run_arguments
+    """
+    configure_cache(enabled = not namespace.no_cache and not namespace.replay, refresh = namespace.refresh)
+    configure_sources(replay_url = namespace.replay)
+    configure_profile(enabled = namespace.profile or namespace.profile_output is not None)
+
+def finish_profile(namespace):
+    """
+    At the end of a run, prints the profile with --profile, and writes it to the file given by --profile-output
+    """
+    if namespace.profile:
+        from tabulate import tabulate
+        print ()
+        print (tabulate(profile_table(), headers = PROFILE_HEADERS))
+    if namespace.profile_output:
+        write_profile(namespace.profile_output)
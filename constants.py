@@ -2,15 +2,108 @@ SAFETY_MARGIN_PERCENTAGE = 25 #Since predicting the future is not perfect, we re
 HISTORIC_MARKET_DISCOUNT_RATE = 9 # Historic return averages of the market
 GROWTH_DECLINE_PERCENTAGE = 5 # As company grows, it growth percentage should decline by this amount in percentage
 FCF_MULTIPLIER_YEAR_10 = 12 # If company is sold after 10 years, the multiplies for the free cash flow, usually in the range[10-15]
-SLEEP_TIME_AFTER_EACH_TICKER = 3 # Sleeps for given number of seconds after processing each ticker
+MAX_CONCURRENT_REQUESTS = 8 # Maximum number of requests in flight at the same time, across all the hosts
+MAX_TICKERS_IN_FLIGHT = 16 # Maximum number of tickers being fetched at the same time, bounds the memory used for long ticker lists
+YAHOO_HOST = 'finance.yahoo.com'
+MORNINGSTAR_HOST = 'financials.morningstar.com'
+RATE_LIMITS_PER_HOST = { # Token bucket for each host as (requests per second, burst size), so we are not blocked for sending too many requests
+    YAHOO_HOST: (2, 4),
+    MORNINGSTAR_HOST: (2, 4),
+}
+DEFAULT_RATE_LIMIT = (1, 1) # Token bucket for any host not listed above
+HTTP_TIMEOUT_SECONDS = (5, 30) # Timeouts for (connecting, reading the response) of every http request
+HTTP_MAX_RETRIES = 3 # Number of times a request is retried when it fails or the server answers 429 or 5xx
+HTTP_BACKOFF_SECONDS = 1 # Base wait before a retry, doubled after every attempt and randomly jittered
+HTTP_RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+#Constants for the cache of the responses from the sources
+CACHE_FILE = 'cache.sqlite3' # SQLite file where responses are cached between runs
+UNTIL_NEXT_QUARTER = 'until_next_quarter' # TTL for data which only changes when the companies report, expires at the start of next quarter
+CACHE_TTL_SECONDS = { # How long the response of each endpoint stays fresh, in seconds or UNTIL_NEXT_QUARTER
+    'live_price': 30,
+    'stats': 24 * 60 * 60,
+    'analysts_info': 24 * 60 * 60,
+    'balance_sheet': UNTIL_NEXT_QUARTER,
+    'current_valuation': 24 * 60 * 60,
+    'finance_part': UNTIL_NEXT_QUARTER,
+    'balance_sheet_report': UNTIL_NEXT_QUARTER,
+    'key_stats': UNTIL_NEXT_QUARTER,
+}
+
+#Sources of the data
+YAHOO = 'yahoo'
+MORNINGSTAR = 'morningstar'
+SOURCE_HOSTS = {YAHOO: YAHOO_HOST, MORNINGSTAR: MORNINGSTAR_HOST}
+YAHOO_QUOTE_URL = 'https://query1.finance.yahoo.com/v7/finance/quote?symbols=' # Quotes of many comma separated tickers in a single request
+QUOTE_BATCH_SIZE = 200 # Most tickers quoted per request, the live prices of the other tickers are quoted in further requests
 ROUND_DECIMALS = 2 #Rounds values to given decimal place, 14.234213 = 14.23
 
+#Constants for the snapshots of every run
+SNAPSHOT_DIRECTORY = 'snapshots' # Directory of the parquet files with the ticker_data and valuations of every run, partitioned by date
+SNAPSHOT_MAX_AGE_SECONDS = 24 * 60 * 60 # With --incremental, tickers fetched more recently than this are not fetched again
+TICKER_DATA_FIELDS = [ # All the fields of ticker_data, see fetch_tickers.fetch_ticker_data
+    'total_debt',
+    'total_shareholders_equity',
+    'expected_growth_rate_future_in_percentage_5_years',
+    'conservative_growth_rate',
+    'earnings_per_share_ttm',
+    'trailing_annual_dividend_rate',
+    'shares_outstanding',
+    'current_price',
+    'historical_price_earnings_ratio_5_years',
+    'roe_average_5_years',
+    'cash_and_cash_equivalents',
+    'free_cash_flow_ttm',
+]
+VALUATION_NAMES = ['price_earnings_valuation', 'discounted_cash_flow_valuation', 'roe_valuation']
+
+#Constants for the dividend calendar
+DIVIDEND_CALENDAR_FILE = 'dividend_calendar.json' # File where the next ex-dividend date of every ticker is kept between runs
+
+#Constants for the service (see service.py)
+SERVICE_PORT = 8080 # Local port the JSON API is served at
+SERVICE_REFRESH_INTERVAL_SECONDS = 10 # How often the service refreshes the fields whose TTL (see CACHE_TTL_SECONDS) has expired
+
+#Constants for the watch mode (see watch.py)
+WATCH_PRICE_INTERVAL_SECONDS = 30 # How often the prices are polled, the same as the TTL of the live prices
+WATCH_FUNDAMENTALS_INTERVAL_SECONDS = 24 * 60 * 60 # How often the fundamentals are fetched again and the tickers valued again
+WATCH_MARGIN_OF_SAFETY_THRESHOLD = 25 # An event is emitted when the margin of safety of a ticker, in percentage, crosses this threshold
+
+#Constants for the backtest (see backtest.py)
+BACKTEST_DIRECTORY = 'backtest_data' # Directory of the .npy files with the daily prices and the fundamentals history
+BACKTEST_FUNDAMENTAL_FIELDS = [field for field in TICKER_DATA_FIELDS if field != 'current_price'] # Fields kept in the fundamentals history
+BACKTEST_REBALANCE_DAYS = 63 # Trading days between two rebalance dates, about a quarter
+BACKTEST_HOLDING_DAYS = 252 # Trading days each portfolio is held for its forward return, about a year
+BACKTEST_CHUNK_DATES = 32 # Number of rebalance dates valued at once, bounds the memory used to chunk dates x tickers
+
+#Constants for the screener
+SCREENER_FIELDS = ['ticker', 'current_price'] + VALUATION_NAMES # Fields of every row written by the screener
+
+#Constants for the sharded runs (see shards.py)
+SHARD_DIRECTORY = 'shards' # Directory of the partial results of every shard, shared by all the workers and hosts
+NUM_SHARDS = 4 # Number of shards the tickers are split into by default, each run by its own worker process
+
+#Constants for the sweep over the valuation assumptions
+SWEEP_PARAMETER_RANGES = { # (lowest, highest) value of each assumption swept over
+    'safety_margin_percentage': (10, 40),
+    'discount_rate_in_percentage': (6, 12),
+    'growth_decline_percentage': (0, 10),
+    'fcf_multiplier': (10, 15),
+}
+SWEEP_PERCENTILES = [5, 25, 50, 75, 95] # Percentiles of the intrinsic values reported for each ticker
+SWEEP_CHUNK_SIZE = 100000 # Number of assumption samples evaluated by a worker process at once
+
 #Constants for pretty print
 TICKER = "Ticker"
 CURRENT_PRICE = "Current Price"
 P_E_VALUATION = "P/E Valuation"
 DCF_VALUATION = "DCF Valuation"
 ROE_VALUATION = "ROE Valuation"
+VALUATION = "Valuation"
+VALUATION_HEADERS = {'price_earnings_valuation': P_E_VALUATION, 'discounted_cash_flow_valuation': DCF_VALUATION, 'roe_valuation': ROE_VALUATION}
 EX_DIVIDEND_DATE = 'EX Dividend date'
 DAYS_TO_DIVIDEND = 'Days to Dividend'
 EXPECTED_DIVIDEND = 'Expected Dividend'
+PREVIOUS_VALUE = "Previous"
+CURRENT_VALUE = "Current"
+CHANGE_PERCENTAGE = "Change %"
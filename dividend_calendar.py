@@ -0,0 +1,126 @@
+import bisect
+import calendar
+import datetime
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from constants import *
+
+class DividendCalendar:
+    """
+    Index of the next ex-dividend date and expected dividend of every ticker, kept sorted by ex-dividend date,
+    so that range queries are a binary search instead of a scan and sort of all the tickers.
+    """
+    def __init__(self):
+        self.keys = [] # Sorted list of (ex_dividend_date, ticker)
+        self.dividends = {} # ticker -> (ex_dividend_date, expected_dividend)
+        self.checked_without_date = {} # ticker -> date it was last checked, for tickers without a known ex-dividend date
+
+    def add(self, ticker, ex_dividend_date, expected_dividend):
+        """
+        Sets the next ex-dividend date (a datetime.date) and expected dividend of the ticker, replacing its previous entry
+        """
+        self.remove(ticker)
+        bisect.insort(self.keys, (ex_dividend_date, ticker))
+        self.dividends[ticker] = (ex_dividend_date, expected_dividend)
+
+    def add_without_date(self, ticker, checked_on):
+        """
+        Records that the ticker has no known ex-dividend date as of the checked_on date, so it is not fetched again the same day
+        """
+        self.remove(ticker)
+        self.checked_without_date[ticker] = checked_on
+
+    def remove(self, ticker):
+        if ticker in self.dividends:
+            ex_dividend_date, _ = self.dividends.pop(ticker)
+            del self.keys[bisect.bisect_left(self.keys, (ex_dividend_date, ticker))]
+        self.checked_without_date.pop(ticker, None)
+
+    def between(self, start_date, end_date):
+        """
+        Returns the list of (ex_dividend_date, ticker, expected_dividend) with ex-dividend dates from start_date to end_date (both included),
+        sorted by ex-dividend date. end_date can be None for all dates from start_date.
+        """
+        start = bisect.bisect_left(self.keys, (start_date,))
+        end = len(self.keys) if end_date is None else bisect.bisect_left(self.keys, (end_date + datetime.timedelta(days = 1),))
+        return [(ex_dividend_date, ticker, self.dividends[ticker][1]) for ex_dividend_date, ticker in self.keys[start:end]]
+
+    def next_days(self, days, today = None):
+        """
+        Returns the entries (see between) going ex-dividend in the next given number of days, today included
+        """
+        today = today or datetime.date.today()
+        return self.between(today, today + datetime.timedelta(days = days))
+
+    def this_month(self, today = None):
+        """
+        Returns the entries (see between) going ex-dividend from today until the end of this month
+        """
+        today = today or datetime.date.today()
+        return self.between(today, today.replace(day = calendar.monthrange(today.year, today.month)[1]))
+
+    def by_ticker(self, ticker):
+        """
+        Returns (ex_dividend_date, expected_dividend) of the ticker, or None if it is not known
+        """
+        return self.dividends.get(ticker)
+
+    def tickers_to_refresh(self, my_tickers, today = None):
+        """
+        Returns the tickers which have to be fetched again: those whose known ex-dividend date has passed,
+        and those without a known ex-dividend date which were not checked today
+        """
+        today = today or datetime.date.today()
+        stale_tickers = []
+        for ticker in my_tickers:
+            if ticker in self.dividends:
+                is_stale = self.dividends[ticker][0] < today
+            else:
+                is_stale = self.checked_without_date.get(ticker, datetime.date.min) < today
+            if is_stale:
+                stale_tickers.append(ticker)
+        return stale_tickers
+
+    def refresh(self, my_tickers, fetch_next_dividend, today = None, refresh_all = False):
+        """
+        Fetches concurrently the next dividend of the tickers which need it (see tickers_to_refresh), or of all of them if refresh_all.
+        fetch_next_dividend takes a ticker and returns (ex_dividend_date, expected_dividend), or raises an exception if it cannot be read.
+        Returns the list of fetched tickers.
+        """
+        today = today or datetime.date.today()
+        stale_tickers = list(my_tickers) if refresh_all else self.tickers_to_refresh(my_tickers, today)
+        def fetch(ticker):
+            try:
+                return fetch_next_dividend(ticker)
+            except:
+                return None
+        with ThreadPoolExecutor(max_workers = MAX_CONCURRENT_REQUESTS) as executor:
+            for ticker, next_dividend in zip(stale_tickers, executor.map(fetch, stale_tickers)):
+                if next_dividend is None:
+                    self.add_without_date(ticker, today)
+                else:
+                    self.add(ticker, *next_dividend)
+        return stale_tickers
+
+    def save(self, path = DIVIDEND_CALENDAR_FILE):
+        with open(path, 'w') as calendar_file:
+            json.dump({
+                'dividends': {ticker: [ex_dividend_date.isoformat(), expected_dividend] for ticker, (ex_dividend_date, expected_dividend) in self.dividends.items()},
+                'checked_without_date': {ticker: checked_on.isoformat() for ticker, checked_on in self.checked_without_date.items()},
+            }, calendar_file)
+
+def load_dividend_calendar(path = DIVIDEND_CALENDAR_FILE):
+    """
+    Loads the calendar saved at the given path, or returns an empty calendar if there is none
+    """
+    dividend_calendar = DividendCalendar()
+    if not os.path.exists(path):
+        return dividend_calendar
+    with open(path) as calendar_file:
+        saved = json.load(calendar_file)
+    for ticker, (ex_dividend_date, expected_dividend) in saved['dividends'].items():
+        dividend_calendar.dividends[ticker] = (datetime.date.fromisoformat(ex_dividend_date), expected_dividend)
+    dividend_calendar.keys = sorted((ex_dividend_date, ticker) for ticker, (ex_dividend_date, _) in dividend_calendar.dividends.items())
+    dividend_calendar.checked_without_date = {ticker: datetime.date.fromisoformat(checked_on) for ticker, checked_on in saved['checked_without_date'].items()}
+    return dividend_calendar
@@ -1,37 +1,77 @@
 #!/usr/bin/env python
 
-from yahoo_fin.stock_info import *
 import tickers
 import argparse
 import datetime
-from tabulate import tabulate
 from constants import *
-import time
+from cli import add_run_arguments, configure_run, finish_profile
+from sources import fetch_source
+from dividend_calendar import DividendCalendar, load_dividend_calendar
 from utils import *
 
+def fetch_next_dividend(ticker):
+    """
+    Fetches the next dividend of the given ticker, and returns (ex_dividend_date as a datetime.date, quaterly_expected_dividend).
+    Raises an exception if it cannot be read.
+    """
+    stats_info = fetch_source(YAHOO, 'stats', ticker)
+    ex_dividend_date = datetime.datetime.strptime(stats_info['Ex-Dividend Date 4'], '%b %d, %Y').date()
+    forward_annual_dividend_rate = float(stats_info['Forward Annual Dividend Rate 4'])
+    return ex_dividend_date, round_values(forward_annual_dividend_rate / 4)
+
+def prepare_to_print(ticker, ex_dividend_date, expected_dividend, today):
+    """
+    prepares a list of values for the given dividend to be printed on screen.
+    FORMAT:
+    [TICKER, ExDividendDate, DaysToDividend, ExpectedDividend]
+    """
+    return [ticker.upper(), ex_dividend_date.strftime('%b %d, %Y'), (ex_dividend_date - today).days, expected_dividend]
+
+def get_dividend_table(my_tickers, dividend_calendar = None, days = None, this_month = False, refresh_all = False):
+    """
+    Refreshes the dividend calendar for the given tickers, fetching only those whose ex-dividend date has passed or is not known,
+    and returns the rows to be printed (see prepare_to_print) of their upcoming dividends, sorted by ex-dividend date.
+    INPUT:
+        dividend_calendar: the DividendCalendar to refresh and query, by default a new empty one, so that every ticker is fetched
+        days: only the dividends in the next given number of days
+        this_month: only the dividends until the end of this month
+        refresh_all: fetch all the tickers, even if their ex-dividend date is still upcoming
+    """
+    dividend_calendar = dividend_calendar or DividendCalendar()
+    today = datetime.date.today()
+    #The rate limit of yahoo is respected by each request not answered by the cache
+    for ticker in dividend_calendar.refresh(my_tickers, fetch_next_dividend, today, refresh_all):
+        if ticker in dividend_calendar.checked_without_date:
+            print ("Cannot read stats info for %s"%(ticker))
+    if days is not None:
+        entries = dividend_calendar.next_days(days, today)
+    elif this_month:
+        entries = dividend_calendar.this_month(today)
+    else:
+        entries = dividend_calendar.between(today, None)
+    my_tickers = set(my_tickers)
+    return [prepare_to_print(ticker, ex_dividend_date, expected_dividend, today) for ex_dividend_date, ticker, expected_dividend in entries if ticker in my_tickers]
+
 if __name__ == '__main__':
+    #Only needed to print the results, not when the functions above are imported by other modules
+    from tabulate import tabulate
     args = argparse.ArgumentParser()
     args.add_argument('--ticker', help = 'Run only for the given ticker')
+    args.add_argument('--days', type = int, help = 'Only show the dividends in the next given number of days')
+    args.add_argument('--month', action = 'store_true', help = 'Only show the dividends until the end of this month')
+    add_run_arguments(args)
     namespace, extra_params = args.parse_known_args()
+    configure_run(namespace)
 
     #If there is --ticker argument, use that, otherwise read the entire list of tickers in tickers.py
     my_tickers = tickers.dividend_tickers
     if (namespace.ticker):
         my_tickers = [namespace.ticker]
 
-    result = []
-    for ticker in my_tickers:
-        try:
-            stats_info = get_stats(ticker)
-            stats_info = dict(zip(stats_info['Attribute'], stats_info['Value']))
-            ex_dividend_date = stats_info['Ex-Dividend Date 4']
-            forward_annual_dividend_rate = float(stats_info['Forward Annual Dividend Rate 4'])
-            quaterly_expected_dividend = round_values(forward_annual_dividend_rate / 4)
-            days_from_today = (datetime.datetime.strptime(ex_dividend_date, '%b %d, %Y') - datetime.datetime.today()).days
-            if days_from_today >= 0:
-                result.append([ticker.upper(), ex_dividend_date, days_from_today, quaterly_expected_dividend])
-        except:
-            print ("Cannot read stats info for %s"%(ticker))
-        time.sleep(SLEEP_TIME_AFTER_EACH_TICKER)
-    result.sort(key = lambda x : x[2])
-    print (tabulate(result, headers = [TICKER, EX_DIVIDEND_DATE, DAYS_TO_DIVIDEND, EXPECTED_DIVIDEND]))
\ No newline at end of file
+    #The calendar is not kept when replaying, as the responses do not come from the real sources
+    dividend_calendar = DividendCalendar() if namespace.replay else load_dividend_calendar()
+    result = get_dividend_table(my_tickers, dividend_calendar, namespace.days, namespace.month, refresh_all = namespace.refresh)
+    if not namespace.replay:
+        dividend_calendar.save()
+    print (tabulate(result, headers = [TICKER, EX_DIVIDEND_DATE, DAYS_TO_DIVIDEND, EXPECTED_DIVIDEND]))
+    finish_profile(namespace)
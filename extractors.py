@@ -0,0 +1,41 @@
+import io
+from profiler import profiled
+
+@profiled('parse.extract_rows')
+def extract_rows(content, row_labels):
+    """
+    Extracts the cells of the table rows whose header contains one of the given labels, in a single pass over the page.
+    Rows are parsed one by one as the page is read, and dropped as soon as they are checked, so the full page is never kept in memory.
+    Parsing stops as soon as all the rows are found.
+    INPUT:
+        content: The html content of the page
+        row_labels: list of labels such as 'Free Cash Flow', each matching the first row whose <th> text contains it
+    OUTPUT:
+        Dictionary of label -> list of the text of each <td> of its row. Labels which are not found are missing.
+    """
+    import lxml.etree
+    rows = {}
+    for _, row in lxml.etree.iterparse(io.BytesIO(content.encode('utf-8')), events = ('end',), tag = 'tr', html = True, encoding = 'utf-8', recover = True):
+        header = row.find('.//th')
+        if header is not None:
+            header_text = ''.join(header.itertext())
+            for label in row_labels:
+                if label not in rows and label in header_text:
+                    rows[label] = [''.join(cell.itertext()) for cell in row.iter('td')]
+        row.clear()
+        if len(rows) == len(row_labels):
+            break
+    return rows
+
+@profiled('parse.extract_attribute_by_id')
+def extract_attribute_by_id(content, parent_id, child_id, attribute):
+    """
+    Returns the given attribute of the element with id child_id inside the element with id parent_id.
+    Raises KeyError if there is no such element or attribute.
+    """
+    import lxml.html
+    values = lxml.html.fromstring(content).xpath('//*[@id=$parent_id]//*[@id=$child_id]/@*[name()=$attribute]',
+        parent_id = parent_id, child_id = child_id, attribute = attribute)
+    if not values:
+        raise KeyError('%s not found in #%s #%s' % (attribute, parent_id, child_id))
+    return values[0]
@@ -0,0 +1,49 @@
+from constants import *
+
+#The (source, endpoint) each field is fetched from. The dividend fields are not part of ticker_data, but are read by dividends.py.
+FIELD_ENDPOINTS = {
+    'roe_average_5_years': (MORNINGSTAR, 'key_stats'),
+    'total_shareholders_equity': (YAHOO, 'balance_sheet'),
+    'historical_price_earnings_ratio_5_years': (MORNINGSTAR, 'current_valuation'),
+    'expected_growth_rate_future_in_percentage_5_years': (YAHOO, 'analysts_info'),
+    'conservative_growth_rate': (YAHOO, 'analysts_info'),
+    'earnings_per_share_ttm': (YAHOO, 'stats'),
+    'total_debt': (YAHOO, 'stats'),
+    'trailing_annual_dividend_rate': (YAHOO, 'stats'),
+    'shares_outstanding': (YAHOO, 'stats'),
+    'free_cash_flow_ttm': (MORNINGSTAR, 'finance_part'),
+    'current_price': (YAHOO, 'live_price'),
+    'cash_and_cash_equivalents': (MORNINGSTAR, 'balance_sheet_report'),
+    'ex_dividend_date': (YAHOO, 'stats'),
+    'expected_dividend': (YAHOO, 'stats'),
+}
+
+#The fields each consumer needs: each valuation model, the price display, and the dividend report
+CONSUMER_FIELDS = {
+    'price_earnings_valuation': ['earnings_per_share_ttm', 'historical_price_earnings_ratio_5_years', 'conservative_growth_rate'],
+    'discounted_cash_flow_valuation': ['cash_and_cash_equivalents', 'total_debt', 'free_cash_flow_ttm', 'shares_outstanding', 'conservative_growth_rate'],
+    'roe_valuation': ['total_shareholders_equity', 'roe_average_5_years', 'shares_outstanding', 'trailing_annual_dividend_rate', 'conservative_growth_rate'],
+    'current_price': ['current_price'],
+    'dividends': ['ex_dividend_date', 'expected_dividend'],
+}
+
+def get_required_fields(consumers):
+    """
+    Returns the list of fields needed by all the given consumers (see CONSUMER_FIELDS), without duplicates
+    """
+    return list(dict.fromkeys(field for consumer in consumers for field in CONSUMER_FIELDS[consumer]))
+
+def get_shared_endpoints(consumer_groups):
+    """
+    Returns the set of (source, endpoint) needed by more than one of the given lists of consumers, such as the valuations and the dividends
+    of a main.py --dividends run, whose responses are worth keeping until both have read them (see sources.fetch_once_per_run)
+    """
+    endpoint_groups = [set(plan_endpoints(consumers)) for consumers in consumer_groups]
+    return set(endpoint for i, endpoints in enumerate(endpoint_groups) for other_endpoints in endpoint_groups[i + 1:]
+        for endpoint in endpoints & other_endpoints)
+
+def plan_endpoints(consumers):
+    """
+    Returns the list of (source, endpoint) to fetch for a ticker, so that all the given consumers have their fields, each endpoint once
+    """
+    return list(dict.fromkeys(FIELD_ENDPOINTS[field] for field in get_required_fields(consumers)))
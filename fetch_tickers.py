@@ -1,12 +1,18 @@
-from yahoo_fin.stock_info import *
 from utils import *
 from constants import *
+from sources import fetch_source, fetch_live_prices
+from extractors import extract_rows, extract_attribute_by_id
+from profiler import profile_stage
+from ticker_data import TickerData
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import collections
+import itertools
 import statistics
 
 def fetch_ticker_data(ticker):
     """
     Fetches all the required data for the given ticker from multiple sources (yahoo finances, and morningstar.com)
-    Returned data structure has the following fields:
+    Returned data structure is a TickerData (see ticker_data.py), used like a dictionary, with the following fields:
     {
         total_debt,
         total_shareholders_equity,
@@ -22,101 +28,184 @@ def fetch_ticker_data(ticker):
         free_cash_flow_ttm
     }
 
-    It calls various private methods below to fulfill this information.
+    It calls various private methods below to fulfill this information. Fields which cannot be read are missing (see TickerData.missing).
     Companies which are less than 5 years old have the historical_price_earnings_ratio_5_years as 0 and roe_average_5_years computed since its epoch.
 
     Finally it also validates the values to get rid of nans for the above cases.
     """
-    ticker_data = {}
-    _get_return_of_equity_historic_average(ticker, ticker_data)
-    _get_balance_sheet_info(ticker, ticker_data)
-    _get_historical_price_earning_ratio(ticker, ticker_data)
-    _get_growth_rate(ticker, ticker_data)
-    _get_stats(ticker, ticker_data)
-    _get_free_cash_flow(ticker, ticker_data)
-    _get_live_price(ticker, ticker_data)
-    _get_cash_and_cash_equivalents(ticker, ticker_data)
-    validate_values(ticker_data)
-    return ticker_data
+    for _, ticker_data in iterate_ticker_data([ticker]):
+        return ticker_data
+
+def iterate_ticker_data(tickers, endpoints = None):
+    """
+    Fetches the data for all the given tickers concurrently, and yields (ticker, ticker_data) as soon as all the data of a ticker is fetched.
+    The ticker_data has the same fields as in fetch_ticker_data, or only the fields of the given list of (source, endpoint),
+    as planned by fetch_planner.plan_endpoints.
+
+    Every private method below is an independent request, so they all run in a pool of MAX_CONCURRENT_REQUESTS threads, across tickers.
+    Instead of sleeping after each ticker, each request waits for the rate limit of its host (see RATE_LIMITS_PER_HOST in constants.py),
+    unless its response is still fresh in the cache.
+    At most MAX_TICKERS_IN_FLIGHT tickers are fetched at the same time, so the memory used does not grow with the number of tickers.
+
+    The live prices are quoted QUOTE_BATCH_SIZE tickers at a time (see sources.fetch_live_prices), reading that many tickers ahead,
+    and only the tickers missing from the quotes have their live price fetched on its own.
+    """
+    fetchers = {endpoint: TICKER_DATA_FETCHERS[endpoint] for endpoint in (endpoints or TICKER_DATA_FETCHERS)}
+    quote_prices = (YAHOO, 'live_price') in fetchers
+    ticker_iterator = iter(tickers)
+    read_ahead = collections.deque()  # tickers read from the iterator, whose live prices are quoted together
+    prices = {}     # ticker -> quoted live price, for the tickers read ahead
+    in_flight = {}  # future -> ticker it is fetching for
+    remaining = {}  # ticker -> number of its requests still running
+    results = {}    # ticker -> ticker_data being filled
+    with ThreadPoolExecutor(max_workers = MAX_CONCURRENT_REQUESTS) as executor:
+        def next_ticker():
+            if not read_ahead:
+                read_ahead.extend(itertools.islice(ticker_iterator, QUOTE_BATCH_SIZE if quote_prices else 1))
+                if quote_prices:
+                    prices.update(_get_live_prices(list(dict.fromkeys(read_ahead))))
+            return read_ahead.popleft() if read_ahead else None
+
+        def submit_next_ticker():
+            ticker = next_ticker()
+            while ticker is not None and ticker in remaining:
+                ticker = next_ticker()
+            if ticker is None:
+                return False
+            results[ticker] = TickerData()
+            results[ticker].failed_endpoints = []
+            ticker_fetchers = dict(fetchers)
+            if ticker in prices:
+                ticker_fetchers[(YAHOO, 'live_price')] = _quoted_price_setter(prices.pop(ticker))
+            remaining[ticker] = len(ticker_fetchers)
+            for fetcher in ticker_fetchers.values():
+                in_flight[executor.submit(fetcher, ticker, results[ticker])] = ticker
+            return True
+
+        while len(remaining) < MAX_TICKERS_IN_FLIGHT and submit_next_ticker():
+            pass
+        while in_flight:
+            done, _ = wait(in_flight, return_when = FIRST_COMPLETED)
+            for future in done:
+                ticker = in_flight.pop(future)
+                remaining[ticker] -= 1
+                if remaining[ticker] == 0:
+                    del remaining[ticker]
+                    ticker_data = results.pop(ticker)
+                    ticker_data.validate()
+                    submit_next_ticker()
+                    yield ticker, ticker_data
+
+def _fetch_source(ticker_data, source, endpoint, ticker):
+    #Fetches the response as sources.fetch_source does, remembering in ticker_data the endpoints which could not be fetched,
+    #so that a ticker whose fetches failed can be told apart from one whose data was fetched but is missing some fields
+    try:
+        return fetch_source(source, endpoint, ticker)
+    except:
+        ticker_data.failed_endpoints.append((source, endpoint))
+        raise
 
 def _get_balance_sheet_info(ticker, ticker_data):
     try:
-        balance_sheet_info = get_balance_sheet(ticker)
-        balance_sheet_info = balance_sheet_info[balance_sheet_info.columns[0]]
-        ticker_data['total_shareholders_equity'] = convert_to_number(balance_sheet_info['totalStockholderEquity'])
+        with profile_stage('fetch._get_balance_sheet_info'):
+            balance_sheet_info = _fetch_source(ticker_data, YAHOO, 'balance_sheet', ticker)
+            ticker_data['total_shareholders_equity'] = convert_to_number(balance_sheet_info['totalStockholderEquity'])
     except:
         print ("Cannot read balance sheet info for %s"%(ticker))
 
 def _get_growth_rate(ticker, ticker_data):
     try:
-        analysts_info = get_analysts_info(ticker)
-        growth_rate_next_5_years_string = analysts_info['Growth Estimates'][ticker][4]
-        ticker_data['expected_growth_rate_future_in_percentage_5_years'] = convert_to_number(growth_rate_next_5_years_string[:-1])
-        ticker_data['conservative_growth_rate'] = apply_margin_of_safety(ticker_data['expected_growth_rate_future_in_percentage_5_years'], SAFETY_MARGIN_PERCENTAGE)
+        with profile_stage('fetch._get_growth_rate'):
+            growth_estimates = _fetch_source(ticker_data, YAHOO, 'analysts_info', ticker)
+            growth_rate_next_5_years_string = growth_estimates[ticker][4]
+            ticker_data['expected_growth_rate_future_in_percentage_5_years'] = convert_to_number(growth_rate_next_5_years_string[:-1])
+            ticker_data['conservative_growth_rate'] = apply_margin_of_safety(ticker_data['expected_growth_rate_future_in_percentage_5_years'], SAFETY_MARGIN_PERCENTAGE)
     except:
         print ("Cannot read analysts info for %s"%(ticker))
 
 def _get_stats(ticker, ticker_data):
     try:
-        stats_info = get_stats(ticker)
-        stats_info = dict(zip(stats_info['Attribute'], stats_info['Value']))
-        ticker_data['earnings_per_share_ttm'] = convert_to_number(stats_info['Diluted EPS (ttm)'])
-        ticker_data['total_debt'] = convert_abbreviated_strings_to_numbers(stats_info['Total Debt (mrq)'])
-        ticker_data['trailing_annual_dividend_rate'] = convert_to_number(stats_info['Trailing Annual Dividend Rate 3'])
-        ticker_data['shares_outstanding'] = convert_abbreviated_strings_to_numbers(stats_info['Shares Outstanding 5'])
+        with profile_stage('fetch._get_stats'):
+            stats_info = _fetch_source(ticker_data, YAHOO, 'stats', ticker)
+            ticker_data['earnings_per_share_ttm'] = convert_to_number(stats_info['Diluted EPS (ttm)'])
+            ticker_data['total_debt'] = convert_abbreviated_strings_to_numbers(stats_info['Total Debt (mrq)'])
+            ticker_data['trailing_annual_dividend_rate'] = convert_to_number(stats_info['Trailing Annual Dividend Rate 3'])
+            ticker_data['shares_outstanding'] = convert_abbreviated_strings_to_numbers(stats_info['Shares Outstanding 5'])
     except:
         print ("Cannot read stats info for %s"%(ticker))
 
 def _get_live_price(ticker, ticker_data):
     try:
-        live_price = get_live_price(ticker)
-        ticker_data['current_price'] = convert_to_number(live_price)
+        with profile_stage('fetch._get_live_price'):
+            live_price = _fetch_source(ticker_data, YAHOO, 'live_price', ticker)
+            ticker_data['current_price'] = convert_to_number(live_price)
     except:
         print ("Cannot read live price for %s"%(ticker))
 
+def _get_live_prices(tickers):
+    try:
+        with profile_stage('fetch._get_live_prices'):
+            return {ticker: convert_to_number(price) for ticker, price in fetch_live_prices(tickers).items()}
+    except:
+        print ("Cannot read live prices of %d tickers, fetching them one by one"%(len(tickers)))
+        return {}
+
+def _quoted_price_setter(price):
+    #Fills the current_price with a price quoted in a batch, in place of _get_live_price
+    def set_quoted_price(ticker, ticker_data):
+        ticker_data['current_price'] = price
+    return set_quoted_price
+
 def _get_historical_price_earning_ratio(ticker, ticker_data):
     try:
-        url = 'http://financials.morningstar.com/valuate/current-valuation-list.action?t=' + ticker
-        soup = scrape_url_to_soup(url)
-        price_earnings_tag = soup.find(lambda tag:tag.name == 'th' and 'Price/Earnings' in tag.text)
-        historic_price_earning_ratio = price_earnings_tag.parent.find_all('td')[3].text
-        #If we do not have 5 year average data for P/E for this ticker, fall back to the most recent data
-        if historic_price_earning_ratio == '—':
-            historic_price_earning_ratio = price_earnings_tag.parent.find_all('td')[0].text
-        ticker_data['historical_price_earnings_ratio_5_years'] = convert_to_number(historic_price_earning_ratio) if historic_price_earning_ratio  != '—' else 0
+        with profile_stage('fetch._get_historical_price_earning_ratio'):
+            price_earnings_cells = extract_rows(_fetch_source(ticker_data, MORNINGSTAR, 'current_valuation', ticker), ['Price/Earnings'])['Price/Earnings']
+            historic_price_earning_ratio = price_earnings_cells[3]
+            #If we do not have 5 year average data for P/E for this ticker, fall back to the most recent data
+            if historic_price_earning_ratio == '—':
+                historic_price_earning_ratio = price_earnings_cells[0]
+            ticker_data['historical_price_earnings_ratio_5_years'] = convert_to_number(historic_price_earning_ratio) if historic_price_earning_ratio  != '—' else 0
     except:
         print ("Cannot read historic_price_earning_ratio for ticker %s"%(ticker))
 
 def _get_free_cash_flow(ticker, ticker_data):
     try:
-        url = 'http://financials.morningstar.com/finan/financials/getFinancePart.html?t=' + ticker
-        soup = scrape_url_to_soup(url)
-        free_cash_flow_tag = soup.find(lambda tag:tag.name == 'th' and 'Free Cash Flow' in tag.text)
-        free_cash_flow_text = free_cash_flow_tag.parent.find_all('td')[10].text.replace(",", "")
-        ticker_data['free_cash_flow_ttm'] = convert_to_number(free_cash_flow_text) * (10**6)
+        with profile_stage('fetch._get_free_cash_flow'):
+            free_cash_flow_cells = extract_rows(_fetch_source(ticker_data, MORNINGSTAR, 'finance_part', ticker), ['Free Cash Flow'])['Free Cash Flow']
+            free_cash_flow_text = free_cash_flow_cells[10].replace(",", "")
+            ticker_data['free_cash_flow_ttm'] = convert_to_number(free_cash_flow_text) * (10**6)
     except:
         print ("Cannot read free_cash_flow_ttm for ticker %s"%(ticker))
 
 def _get_cash_and_cash_equivalents(ticker, ticker_data):
     try:
-        url = 'http://financials.morningstar.com/ajax/ReportProcess4HtmlAjax.html?reportType=bs&t=' + ticker
-        soup = scrape_url_to_jsonsoup(url)
-        cash_and_cash_equivalent_tag = soup.find(id = 'data_i1')
-        current_year_cash = cash_and_cash_equivalent_tag.find(id = 'Y_5')
-        ticker_data['cash_and_cash_equivalents'] = convert_to_number(current_year_cash['rawvalue'])
+        with profile_stage('fetch._get_cash_and_cash_equivalents'):
+            #Cash and cash equivalents is the first line item of the balance sheet, and Y_5 is its most recent year
+            current_year_cash = extract_attribute_by_id(_fetch_source(ticker_data, MORNINGSTAR, 'balance_sheet_report', ticker), 'data_i1', 'Y_5', 'rawvalue')
+            ticker_data['cash_and_cash_equivalents'] = convert_to_number(current_year_cash)
     except:
         print ("Cannot read cash and cash equivalent for ticker %s"%(ticker))
 
 def _get_return_of_equity_historic_average(ticker, ticker_data):
     try:
-        url = 'http://financials.morningstar.com/finan/financials/getKeyStatPart.html?t=' + ticker
-        soup = scrape_url_to_soup(url)
-        roe_tag = soup.find(lambda tag:tag.name == 'th' and 'Return on Equity %' in tag.text)
-        roe_historic = roe_tag.parent.find_all('td')
-        roe_last_5_years = []
-        for i in range(len(roe_historic) - 6, len(roe_historic) - 1):
-            if roe_historic[i].text != '—':
-                roe_last_5_years.append(convert_to_number(roe_historic[i].text))
-        ticker_data['roe_average_5_years'] = statistics.median(roe_last_5_years)
+        with profile_stage('fetch._get_return_of_equity_historic_average'):
+            roe_historic = extract_rows(_fetch_source(ticker_data, MORNINGSTAR, 'key_stats', ticker), ['Return on Equity %'])['Return on Equity %']
+            roe_last_5_years = []
+            for i in range(len(roe_historic) - 6, len(roe_historic) - 1):
+                if roe_historic[i] != '—':
+                    roe_last_5_years.append(convert_to_number(roe_historic[i]))
+            ticker_data['roe_average_5_years'] = statistics.median(roe_last_5_years)
     except:
-        print ("Cannot read ROE for ticker %s"%(ticker))
\ No newline at end of file
+        print ("Cannot read ROE for ticker %s"%(ticker))
+
+#All the independent requests needed to fill ticker_data, by the (source, endpoint) each of them fetches
+TICKER_DATA_FETCHERS = {
+    (MORNINGSTAR, 'key_stats'): _get_return_of_equity_historic_average,
+    (YAHOO, 'balance_sheet'): _get_balance_sheet_info,
+    (MORNINGSTAR, 'current_valuation'): _get_historical_price_earning_ratio,
+    (YAHOO, 'analysts_info'): _get_growth_rate,
+    (YAHOO, 'stats'): _get_stats,
+    (MORNINGSTAR, 'finance_part'): _get_free_cash_flow,
+    (YAHOO, 'live_price'): _get_live_price,
+    (MORNINGSTAR, 'balance_sheet_report'): _get_cash_and_cash_equivalents,
+}
@@ -0,0 +1,92 @@
+import json
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+from cache import get_validators, set_validators
+from constants import *
+from rate_limiter import wait_for_host
+from profiler import profile_stage, record_bytes
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+def get_text(url, rate_limit_host = None):
+    """
+    Fetches the given url and returns the content of the page as text.
+    Every attempt waits for the rate limit of rate_limit_host, by default the host of the url.
+    """
+    with profile_stage('http.' + urlsplit(url).hostname):
+        return _get(url, rate_limit_host)
+
+def get_json(url, rate_limit_host = None):
+    """
+    Fetches the given url which has a json response and returns it parsed, see get_text
+    """
+    with profile_stage('http.' + urlsplit(url).hostname):
+        return json.loads(_get(url, rate_limit_host))
+
+def get_session(host):
+    """
+    Returns the shared session for the given host. Every host has its own pool of up to MAX_CONCURRENT_REQUESTS kept alive connections,
+    so the TCP and TLS handshakes are paid once per connection, instead of once per request.
+    """
+    #requests is only imported once a page is actually fetched, not for runs answered by the cache
+    import requests
+    from requests.adapters import HTTPAdapter
+    with _sessions_lock:
+        if host not in _sessions:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections = 1, pool_maxsize = MAX_CONCURRENT_REQUESTS)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.headers.update({'Accept-Encoding': 'gzip, deflate'})
+            _sessions[host] = session
+        return _sessions[host]
+
+def _get(url, rate_limit_host = None):
+    """
+    Fetches the given url with its host's session, waiting for the rate limit of rate_limit_host (the url's host by default) before every attempt.
+    If the page was fetched before, it is requested conditionally (ETag/If-Modified-Since), and the previous content is reused if unchanged.
+    Connection errors, timeouts, and HTTP_RETRY_STATUS_CODES are retried up to HTTP_MAX_RETRIES times with jittered exponential backoff.
+    Raises an exception if the page still cannot be fetched.
+    """
+    import requests
+    host = urlsplit(url).hostname
+    session = get_session(host)
+    validators = get_validators(url)
+    headers = {}
+    if validators is not None:
+        etag, last_modified, _ = validators
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+    for attempt in range(HTTP_MAX_RETRIES + 1):
+        wait_for_host(rate_limit_host or host)
+        try:
+            response = session.get(url, headers = headers, timeout = HTTP_TIMEOUT_SECONDS)
+            record_bytes('http.' + host, len(response.content))
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == HTTP_MAX_RETRIES:
+                raise
+            time.sleep(_backoff_time(attempt, None))
+            continue
+        if response.status_code in HTTP_RETRY_STATUS_CODES and attempt < HTTP_MAX_RETRIES:
+            time.sleep(_backoff_time(attempt, response.headers.get('Retry-After')))
+            continue
+        break
+    if response.status_code == 304 and validators is not None:
+        return validators[2]
+    response.raise_for_status()
+    if 'ETag' in response.headers or 'Last-Modified' in response.headers:
+        set_validators(url, response.headers.get('ETag'), response.headers.get('Last-Modified'), response.text)
+    return response.text
+
+def _backoff_time(attempt, retry_after):
+    """
+    Returns the seconds to wait before retrying after the given attempt. The server's Retry-After is used if it gives one in seconds.
+    """
+    if retry_after is not None and retry_after.isdigit():
+        return int(retry_after)
+    return HTTP_BACKOFF_SECONDS * (2 ** attempt) * random.uniform(0.5, 1.5)
@@ -2,16 +2,47 @@
 
 import tickers
 from valuation_methods import *
-from fetch_tickers import fetch_ticker_data
-import time
+from fetch_tickers import iterate_ticker_data
+from cli import add_run_arguments, configure_run, finish_profile
+from sources import fetch_once_per_run
+from fetch_planner import plan_endpoints, get_required_fields, get_shared_endpoints
+from dividends import get_dividend_table
+from dividend_calendar import DividendCalendar, load_dividend_calendar
+from watch import watch, format_event
+from snapshots import load_latest_snapshot, write_snapshot, is_fresh, have_same_fundamentals, snapshot_diff
 from constants import *
-from tabulate import tabulate
 from utils import *
 import argparse
+import contextlib
+import sys
+import time
+
+#Each valuation model, computed from a ticker_data. Look at the valuation_methods.py for their descriptions.
+VALUATION_MODELS = {
+    'price_earnings_valuation': lambda ticker_data: price_earnings(ticker_data['earnings_per_share_ttm'],
+        ticker_data['historical_price_earnings_ratio_5_years'],
+        ticker_data['conservative_growth_rate'],
+        5),
+    'discounted_cash_flow_valuation': lambda ticker_data: discounted_cash_flow(ticker_data['cash_and_cash_equivalents'],
+        ticker_data['total_debt'],
+        ticker_data['free_cash_flow_ttm'],
+        ticker_data['shares_outstanding'],
+        ticker_data['conservative_growth_rate'],
+        10),
+    'roe_valuation': lambda ticker_data: roe_valuation(ticker_data['total_shareholders_equity'],
+        ticker_data['roe_average_5_years'],
+        ticker_data['shares_outstanding'],
+        ticker_data['trailing_annual_dividend_rate'],
+        ticker_data['conservative_growth_rate'],
+        10),
+}
 
-def get_valuations(ticker_data):
+#The models which can be chosen with --models
+MODEL_NAMES = {'pe': 'price_earnings_valuation', 'dcf': 'discounted_cash_flow_valuation', 'roe': 'roe_valuation'}
+
+def get_valuations(ticker_data, valuation_names = VALUATION_NAMES):
     """
-    Computes the variation valuation models for the given ticker_data.
+    Computes the variation valuation models for the given ticker_data, by default all of them.
     
     price_earnings_valuation,
     discounted_cash_flow_valuation,
@@ -19,60 +50,158 @@ def get_valuations(ticker_data):
     
     Look at the valuation_methods.py for their descriptions.
     """
-    return {
-        'price_earnings_valuation': price_earnings(ticker_data['earnings_per_share_ttm'],
-            ticker_data['historical_price_earnings_ratio_5_years'],
-            ticker_data['conservative_growth_rate'],
-            5),
-        'discounted_cash_flow_valuation': discounted_cash_flow(ticker_data['cash_and_cash_equivalents'],
-            ticker_data['total_debt'],
-            ticker_data['free_cash_flow_ttm'],
-            ticker_data['shares_outstanding'],
-            ticker_data['conservative_growth_rate'],
-            10),
-        'roe_valuation': roe_valuation(ticker_data['total_shareholders_equity'],
-            ticker_data['roe_average_5_years'],
-            ticker_data['shares_outstanding'],
-            ticker_data['trailing_annual_dividend_rate'],
-            ticker_data['conservative_growth_rate'],
-            10)
-    }
+    return {valuation_name: VALUATION_MODELS[valuation_name](ticker_data) for valuation_name in valuation_names}
 
 def prepare_to_print(ticker, ticker_data, valuations):
     """
     prepares a list of values for the given ticker to be printed on screen.
     FORMAT:
-    [TICKER, CurrentPrice, P/E_Valuation, DCF_Valuation, ROE_Valuation]
+    [TICKER, CurrentPrice, P/E_Valuation, DCF_Valuation, ROE_Valuation], with only the valuations computed (see get_valuation_headers)
+    """
+    return [ticker.upper(), round_values(ticker_data['current_price'])] + \
+        [round_values(valuations[valuation_name]) for valuation_name in VALUATION_NAMES if valuation_name in valuations]
+
+def get_valuation_headers(valuation_names = VALUATION_NAMES):
+    """
+    Returns the headers of the rows returned by prepare_to_print, for the given valuations
+    """
+    return [TICKER, CURRENT_PRICE] + [VALUATION_HEADERS[valuation_name] for valuation_name in VALUATION_NAMES if valuation_name in valuation_names]
+
+def iterate_valuations(my_tickers, previous_snapshot = None, valuation_names = None, on_failure = None, on_fetch_failure = None):
     """
-    return [
-        ticker.upper(),
-        round_values(ticker_data['current_price']),
-        round_values(valuations['price_earnings_valuation']),
-        round_values(valuations['discounted_cash_flow_valuation']),
-        round_values(valuations['roe_valuation'])
-    ]
+    Fetches the data of the given tickers concurrently, and yields a record for each ticker as soon as it is valued:
+    {ticker, fetched_at, ticker_data, valuations, refreshed}
+
+    If valuation_names is given, only these valuations are computed, and only the endpoints they need are fetched (see fetch_planner.py).
+    Such partial records are not comparable with the snapshots, so previous_snapshot should not be given with them.
+
+    Tickers which cannot be valued, because their data cannot be fetched, a field is missing, or a model fails on their data
+    (such as 0 shares outstanding), are reported and skipped. If on_failure is given, it is called with each ticker whose data was fetched
+    but cannot be valued. If on_fetch_failure is given, it is called with each ticker which has no data or whose fetches failed,
+    such as during an outage, so it can be fetched again later.
+
+    If previous_snapshot is given (see snapshots.load_latest_snapshot), tickers with a fresh record in it only have their live price
+    fetched again, quoted in batches, and their record is yielded with that price and refreshed as False. If the price cannot be fetched,
+    the price of the record is kept and reported as stale. Tickers whose fundamentals did not change since their record keep its valuations.
+    """
+    previous_snapshot = previous_snapshot or {}
+    #Without a snapshot, the tickers are read lazily, so that an iterator of any number of tickers can be given
+    stale_tickers = my_tickers
+    if previous_snapshot:
+        stale_tickers = [ticker for ticker in my_tickers if not is_fresh(previous_snapshot.get(ticker))]
+        fresh_tickers = [ticker for ticker in my_tickers if is_fresh(previous_snapshot.get(ticker))]
+        for ticker, price_data in iterate_ticker_data(fresh_tickers, [(YAHOO, 'live_price')]):
+            previous = previous_snapshot[ticker]
+            if 'current_price' in price_data:
+                yield dict(previous, ticker_data = dict(previous['ticker_data'], current_price = price_data['current_price']), refreshed = False)
+            else:
+                print ("Cannot fetch the price of %s, its price is from %s"%(ticker, time.strftime('%Y-%m-%d %H:%M', time.localtime(previous['fetched_at']))))
+                yield dict(previous, refreshed = False)
+    endpoints = None if valuation_names is None else plan_endpoints(valuation_names + ['current_price'])
+    required_fields = get_required_fields((valuation_names or VALUATION_NAMES) + ['current_price'])
+    for ticker, ticker_data in iterate_ticker_data(stale_tickers, endpoints):
+        if len(ticker_data) == 0 or ticker_data.failed_endpoints:
+            if on_fetch_failure is not None:
+                on_fetch_failure(ticker)
+            continue
+        missing_fields = ticker_data.missing(required_fields)
+        valuations = None
+        if missing_fields:
+            print ("Cannot value %s, missing %s"%(ticker, ', '.join(missing_fields)))
+        else:
+            previous = previous_snapshot.get(ticker)
+            if previous is not None and have_same_fundamentals(ticker_data, previous['ticker_data']):
+                valuations = previous['valuations']
+            else:
+                try:
+                    # Compute valuations for this ticker
+                    valuations = get_valuations(ticker_data, valuation_names or VALUATION_NAMES)
+                except:
+                    print ("Cannot value %s"%(ticker))
+        if valuations is None:
+            if on_failure is not None:
+                on_failure(ticker)
+            continue
+        yield {'ticker': ticker, 'fetched_at': time.time(), 'ticker_data': ticker_data, 'valuations': valuations, 'refreshed': True}
+
+def get_valuation_table(my_tickers, valuation_names = None):
+    """
+    Values the given tickers, see iterate_valuations.
+    Returns the rows to be printed (see prepare_to_print), in the same order as the given tickers.
+    """
+    results = {record['ticker']: prepare_to_print(record['ticker'], record['ticker_data'], record['valuations'])
+        for record in iterate_valuations(my_tickers, valuation_names = valuation_names)}
+    return [results[ticker] for ticker in my_tickers if ticker in results]
 
 if __name__ == '__main__':
+    #Only needed to print the results, not when the functions above are imported by other modules
+    from tabulate import tabulate
     #Read the named arguments.
     args = argparse.ArgumentParser()
     args.add_argument('--ticker', help = 'Run only for the given ticker')
+    add_run_arguments(args)
+    args.add_argument('--incremental', action = 'store_true', help = 'Only fetch the tickers not fetched in the last SNAPSHOT_MAX_AGE_SECONDS')
+    args.add_argument('--diff', action = 'store_true', help = 'Print the valuations which changed since the previous snapshot')
+    args.add_argument('--snapshot', action = 'store_true', help = 'Append the fetched tickers to the snapshots, as --incremental and --diff do')
+    args.add_argument('--models', help = 'Comma separated valuation models to compute, out of pe, dcf and roe. Only the data they need is fetched')
+    args.add_argument('--dividends', action = 'store_true', help = 'Also print the upcoming dividends, sharing the fetched responses with the valuations')
+    args.add_argument('--watch', action = 'store_true', help = 'Keep polling the prices, and print when the margin of safety of a ticker crosses --threshold')
+    args.add_argument('--threshold', type = float, default = WATCH_MARGIN_OF_SAFETY_THRESHOLD, help = 'Margin of safety in percentage watched with --watch')
     namespace, extra_params = args.parse_known_args()
+    configure_run(namespace)
 
     #If there is --ticker argument, use that, otherwise read the entire list of tickers in tickers.py
     my_tickers = tickers.my_tickers
     if (namespace.ticker):
         my_tickers = [namespace.ticker]
 
-    results = []
-    for ticker in my_tickers:
-        #Fetch all the relevant data for this ticker
-        ticker_data = fetch_ticker_data(ticker)
-        if len(ticker_data) > 0:
-            # Compute valuations for this ticker
-            valuations = get_valuations(ticker_data)
-            # Append to the table to be printed
-            results.append(prepare_to_print(ticker, ticker_data, valuations))
-        # Rest, just in case we are sending too much requests, and might be blocked in future :)
-        time.sleep(SLEEP_TIME_AFTER_EACH_TICKER)
-    #Print all the results
-    print (tabulate(results, headers = [TICKER, CURRENT_PRICE, P_E_VALUATION, DCF_VALUATION, ROE_VALUATION]))
+    if namespace.watch:
+        try:
+            for event in watch(my_tickers, namespace.threshold):
+                print (format_event(event))
+        except KeyboardInterrupt:
+            pass
+        sys.exit(0)
+
+    valuation_names = None
+    if namespace.models:
+        valuation_names = [MODEL_NAMES[model] for model in namespace.models.split(',')]
+
+    #With --dividends, the responses needed by both the valuations and the dividends are kept, so that they are fetched once for the whole run
+    run_context = contextlib.nullcontext()
+    if namespace.dividends:
+        run_context = fetch_once_per_run(get_shared_endpoints([(valuation_names or VALUATION_NAMES) + ['current_price'], ['dividends']]))
+    with run_context:
+        if valuation_names is None:
+            #The diff compares with the previous record of each ticker, however old it is
+            previous_snapshot = load_latest_snapshot(my_tickers, max_age_seconds = None if namespace.diff else SNAPSHOT_MAX_AGE_SECONDS) \
+                if namespace.incremental or namespace.diff else {}
+            records = list(iterate_valuations(my_tickers, previous_snapshot if namespace.incremental else None))
+        else:
+            #Only some of the fields are fetched, so these records are neither compared with nor added to the snapshots
+            previous_snapshot = {}
+            records = list(iterate_valuations(my_tickers, valuation_names = valuation_names))
+        if namespace.dividends:
+            #The calendar is not kept when replaying, as the responses do not come from the real sources
+            dividend_calendar = DividendCalendar() if namespace.replay else load_dividend_calendar()
+            dividends = get_dividend_table(tickers.dividend_tickers if not namespace.ticker else my_tickers, dividend_calendar, refresh_all = namespace.refresh)
+            if not namespace.replay:
+                dividend_calendar.save()
+    records = {record['ticker']: record for record in records}
+    #Print all the results, in the same order as the given tickers
+    results = [prepare_to_print(ticker, records[ticker]['ticker_data'], records[ticker]['valuations']) for ticker in my_tickers if ticker in records]
+    print (tabulate(results, headers = get_valuation_headers(valuation_names or VALUATION_NAMES)))
+    if namespace.dividends:
+        print ()
+        print (tabulate(dividends, headers = [TICKER, EX_DIVIDEND_DATE, DAYS_TO_DIVIDEND, EXPECTED_DIVIDEND]))
+    if namespace.diff:
+        print ()
+        print (tabulate(snapshot_diff(previous_snapshot, records.values()), headers = [TICKER, VALUATION, PREVIOUS_VALUE, CURRENT_VALUE, CHANGE_PERCENTAGE]))
+    #Append the refreshed tickers to the snapshots, so the next runs can reuse them. Only done when asked for,
+    #as it needs pyarrow, which is slow to import compared to a run answered by the cache
+    if valuation_names is None and (namespace.snapshot or namespace.incremental or namespace.diff):
+        try:
+            write_snapshot([record for record in records.values() if record['refreshed']])
+        except ImportError:
+            print ("Cannot write the snapshot, pyarrow is not installed")
+    finish_profile(namespace)
@@ -0,0 +1,143 @@
+import collections
+import contextlib
+import functools
+import json
+import threading
+import time
+
+_settings = {'enabled': False}
+_stages = {}
+_lock = threading.Lock()
+
+def configure_profile(enabled = True):
+    """
+    Enables or disables recording the timings and counters of every stage. When disabled, the stages cost almost nothing.
+    """
+    _settings['enabled'] = enabled
+
+def reset_profile():
+    with _lock:
+        _stages.clear()
+
+@contextlib.contextmanager
+def profile_stage(name):
+    """
+    Records the wall time of the code in the with block as one call of the given stage.
+    If an exception is raised, it is counted as a failure of the stage with its type, and raised again.
+    """
+    if not _settings['enabled']:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException as exception:
+        _record(name, time.perf_counter() - start, type(exception).__name__)
+        raise
+    _record(name, time.perf_counter() - start, None)
+
+def profiled(name):
+    """
+    Decorator recording every call of the function as one call of the given stage, see profile_stage
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def profiled_function(*args, **kwargs):
+            if not _settings['enabled']:
+                return function(*args, **kwargs)
+            with profile_stage(name):
+                return function(*args, **kwargs)
+        return profiled_function
+    return decorator
+
+def record_bytes(name, num_bytes):
+    """
+    Adds the given number of downloaded bytes to the stage
+    """
+    if _settings['enabled']:
+        with _lock:
+            _get_stage(name)['bytes'] += num_bytes
+
+def record_cache(name, hit):
+    """
+    Counts a cache hit (or miss if hit is False) for the stage
+    """
+    if _settings['enabled']:
+        with _lock:
+            _get_stage(name)['cache_hits' if hit else 'cache_misses'] += 1
+
+def get_profile():
+    """
+    Returns a dictionary of stage -> its counters:
+    {
+        calls, failures, seconds, max_seconds, bytes, cache_hits, cache_misses,
+        errors: dictionary of exception type -> number of failures
+    }
+    """
+    with _lock:
+        return {name: dict(stage, errors = dict(stage['errors'])) for name, stage in sorted(_stages.items())}
+
+def profile_table():
+    """
+    Returns the rows of the profile to be printed, with PROFILE_HEADERS, slowest stages first
+    """
+    rows = []
+    for name, stage in sorted(get_profile().items(), key = lambda item: -item[1]['seconds']):
+        rows.append([name, stage['calls'], stage['failures'], round(stage['seconds'], 3),
+            round(stage['seconds'] / stage['calls'] * 1000, 2) if stage['calls'] else 0, round(stage['max_seconds'] * 1000, 2),
+            round(stage['bytes'] / 1024, 1), stage['cache_hits'], stage['cache_misses'],
+            ', '.join('%s: %d' % error for error in sorted(stage['errors'].items()))])
+    return rows
+
+PROFILE_HEADERS = ['Stage', 'Calls', 'Failures', 'Total (s)', 'Mean (ms)', 'Max (ms)', 'Downloaded (KB)', 'Cache hits', 'Cache misses', 'Errors']
+
+def profile_to_json():
+    return json.dumps(get_profile(), indent = 2, sort_keys = True)
+
+def profile_to_prometheus():
+    """
+    Returns the profile in the Prometheus text exposition format
+    """
+    profile = get_profile()
+    metrics = [
+        ('calls_total', 'Number of calls of the stage', 'calls'),
+        ('seconds_total', 'Wall time spent in the stage', 'seconds'),
+        ('bytes_total', 'Bytes downloaded by the stage', 'bytes'),
+        ('cache_hits_total', 'Responses of the stage read from the cache', 'cache_hits'),
+        ('cache_misses_total', 'Responses of the stage not found in the cache', 'cache_misses'),
+    ]
+    lines = []
+    for metric, description, field in metrics:
+        lines.append('# HELP value_investing_stage_%s %s' % (metric, description))
+        lines.append('# TYPE value_investing_stage_%s counter' % metric)
+        for name, stage in profile.items():
+            lines.append('value_investing_stage_%s{stage="%s"} %s' % (metric, name, stage[field]))
+    lines.append('# HELP value_investing_stage_failures_total Failed calls of the stage, by exception type')
+    lines.append('# TYPE value_investing_stage_failures_total counter')
+    for name, stage in profile.items():
+        for exception, count in sorted(stage['errors'].items()):
+            lines.append('value_investing_stage_failures_total{stage="%s",exception="%s"} %d' % (name, exception, count))
+    return '\n'.join(lines) + '\n'
+
+def write_profile(path):
+    """
+    Writes the profile to the given file, as json if it ends with .json, otherwise in the Prometheus text format
+    """
+    with open(path, 'w') as profile_file:
+        profile_file.write(profile_to_json() if path.endswith('.json') else profile_to_prometheus())
+
+def _record(name, seconds, error):
+    with _lock:
+        stage = _get_stage(name)
+        stage['calls'] += 1
+        stage['seconds'] += seconds
+        stage['max_seconds'] = max(stage['max_seconds'], seconds)
+        if error is not None:
+            stage['failures'] += 1
+            stage['errors'][error] += 1
+
+def _get_stage(name):
+    if name not in _stages:
+        _stages[name] = {'calls': 0, 'failures': 0, 'seconds': 0.0, 'max_seconds': 0.0, 'bytes': 0, 'cache_hits': 0, 'cache_misses': 0,
+            'errors': collections.Counter()}
+    return _stages[name]
@@ -0,0 +1,58 @@
+import threading
+import time
+from constants import *
+from profiler import profile_stage
+
+class TokenBucket:
+    """
+    A thread safe token bucket. Tokens are added at rate_per_second up to capacity, and every request takes one token.
+    If no token is available, acquire blocks until the next token is added.
+    """
+    def __init__(self, rate_per_second, capacity):
+        self.rate_per_second = rate_per_second
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Takes one token from the bucket, sleeping outside the lock until it is available
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate_per_second)
+                self.last_refill = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_time = (1 - self.tokens) / self.rate_per_second
+            time.sleep(wait_time)
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+def get_rate_limiter(host):
+    """
+    Returns the token bucket for the given host, as configured in RATE_LIMITS_PER_HOST. Unknown hosts use DEFAULT_RATE_LIMIT.
+    """
+    with _buckets_lock:
+        if host not in _buckets:
+            rate_per_second, capacity = RATE_LIMITS_PER_HOST.get(host, DEFAULT_RATE_LIMIT)
+            _buckets[host] = TokenBucket(rate_per_second, capacity)
+        return _buckets[host]
+
+def configure_rate_limit(host, rate_per_second, capacity):
+    """
+    Overrides the rate limit of the given host for this process, for example for each shard of a run, or for a local stand-in server
+    """
+    with _buckets_lock:
+        _buckets[host] = TokenBucket(rate_per_second, capacity)
+
+def wait_for_host(host):
+    """
+    Blocks until a request to the given host is allowed by its rate limit
+    """
+    with profile_stage('rate_limit.' + host):
+        get_rate_limiter(host).acquire()
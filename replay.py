@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+
+import tickers
+import argparse
+import collections
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+from cache import configure_cache
+from constants import *
+from sources import SOURCE_ENDPOINTS, configure_sources, fetch_source, get_recording_path, load_recording, save_recording
+
+class StandInServer:
+    """
+    Local http server standing in for the sources, serving the responses recorded in a directory at /<source>/<endpoint>/<ticker>.
+    The batch quotes (see sources.fetch_live_prices) are served at /yahoo/quote?symbols=<comma separated tickers>, from the recorded live prices.
+    Every response is delayed by latency_seconds, and answered with 503 instead with probability error_rate, to test the retries.
+    The number of requests received for each source is counted in request_counts.
+    """
+    def __init__(self, directory, latency_seconds = 0, error_rate = 0, port = 0):
+        self.directory = directory
+        self.latency_seconds = latency_seconds
+        self.error_rate = error_rate
+        self.request_counts = collections.Counter()
+        self.lock = threading.Lock()
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stand_in.handle(self)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.server.daemon_threads = True
+        self.url = 'http://127.0.0.1:%d' % self.server.server_address[1]
+
+    def start(self):
+        threading.Thread(target = self.server.serve_forever, daemon = True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def handle(self, request):
+        url = urlsplit(request.path)
+        path = url.path.strip('/').split('/')
+        with self.lock:
+            self.request_counts[path[0]] += 1
+        time.sleep(self.latency_seconds)
+        try:
+            if random.random() < self.error_rate:
+                status, body = 503, b''
+            elif path == [YAHOO, 'quote']:
+                status, body = 200, json.dumps(self.quote(parse_qs(url.query)['symbols'][0].split(','))).encode('utf-8')
+            else:
+                source, endpoint, ticker = path
+                status, body = 200, json.dumps(load_recording(self.directory, source, endpoint, ticker)).encode('utf-8')
+        except:
+            status, body = 404, b''
+        request.send_response(status)
+        request.send_header('Content-Type', 'application/json')
+        request.send_header('Content-Length', str(len(body)))
+        request.end_headers()
+        request.wfile.write(body)
+
+    def quote(self, symbols):
+        """
+        Returns the batch quote response for the given symbols, in the format of YAHOO_QUOTE_URL, leaving out those without a recorded live price
+        """
+        result = []
+        for symbol in symbols:
+            if os.path.exists(get_recording_path(self.directory, YAHOO, 'live_price', symbol)):
+                result.append({'symbol': symbol, 'regularMarketPrice': load_recording(self.directory, YAHOO, 'live_price', symbol)})
+        return {'quoteResponse': {'result': result, 'error': None}}
+
+def record(my_tickers, directory):
+    """
+    Fetches the responses of every source endpoint for the given tickers, and saves them in the recording directory
+    """
+    configure_sources(recording_directory = directory)
+    def record_response(task):
+        try:
+            fetch_source(*task)
+        except:
+            print ("Cannot record %s %s for %s" % task)
+    tasks = [(source, endpoint, ticker) for ticker in my_tickers for source, endpoint in SOURCE_ENDPOINTS]
+    with ThreadPoolExecutor(max_workers = MAX_CONCURRENT_REQUESTS) as executor:
+        list(executor.map(record_response, tasks))
+
+def clone_recording(directory, ticker, new_tickers):
+    """
+    Copies the recorded responses of the ticker to each of the new tickers, for benchmarking with more tickers than were recorded
+    """
+    for source, endpoint in SOURCE_ENDPOINTS:
+        if not os.path.exists(get_recording_path(directory, source, endpoint, ticker)):
+            continue
+        value = load_recording(directory, source, endpoint, ticker)
+        for new_ticker in new_tickers:
+            #The growth estimates are keyed by the ticker itself
+            if endpoint == 'analysts_info':
+                new_value = {new_ticker if key == ticker else key: column for key, column in value.items()}
+            else:
+                new_value = value
+            save_recording(directory, source, endpoint, new_ticker, new_value)
+
+if __name__ == '__main__':
+    args = argparse.ArgumentParser()
+    args.add_argument('mode', choices = ['record', 'serve'], help = 'record the responses for the tickers, or serve the recorded responses')
+    args.add_argument('--ticker', help = 'Record only the given ticker')
+    args.add_argument('--directory', default = 'recordings', help = 'Directory of the recorded responses')
+    args.add_argument('--port', type = int, default = 8000, help = 'Port of the stand-in server')
+    args.add_argument('--latency', type = float, default = 0, help = 'Seconds the stand-in server waits before every response')
+    args.add_argument('--error-rate', type = float, default = 0, help = 'Fraction of requests the stand-in server answers with 503')
+    namespace, extra_params = args.parse_known_args()
+
+    if namespace.mode == 'record':
+        #Record the tickers of both main.py and dividends.py
+        my_tickers = [namespace.ticker] if namespace.ticker else list(dict.fromkeys(tickers.my_tickers + tickers.dividend_tickers))
+        configure_cache(enabled = False)
+        record(my_tickers, namespace.directory)
+    else:
+        stand_in = StandInServer(namespace.directory, namespace.latency, namespace.error_rate, namespace.port)
+        print ("Serving %s at %s, run main.py or dividends.py with --replay=%s" % (namespace.directory, stand_in.url, stand_in.url))
+        stand_in.server.serve_forever()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+
+import argparse
+import csv
+import json
+import os
+from constants import *
+from main import iterate_valuations
+from cli import add_run_arguments, configure_run, finish_profile
+from utils import *
+
+#Filters of the rows, taking the current price and the valuations of a ticker
+FILTERS = {
+    'none': lambda price, valuations: True,
+    'below_min': lambda price, valuations: price < min(valuations.values()),
+    'below_max': lambda price, valuations: price < max(valuations.values()),
+    'below_pe': lambda price, valuations: price < valuations['price_earnings_valuation'],
+    'below_dcf': lambda price, valuations: price < valuations['discounted_cash_flow_valuation'],
+    'below_roe': lambda price, valuations: price < valuations['roe_valuation'],
+}
+
+def read_tickers(path):
+    """
+    Reads the tickers in the given file lazily, one per line. Empty lines and lines starting with # are skipped.
+    """
+    with open(path) as tickers_file:
+        for line in tickers_file:
+            ticker = line.strip()
+            if ticker and not ticker.startswith('#'):
+                yield ticker
+
+def get_checkpoint_path(output_path):
+    return output_path + '.checkpoint'
+
+def read_checkpoint(output_path):
+    """
+    Returns the set of tickers already processed into the given output, or an empty set if there is no checkpoint
+    """
+    if not os.path.exists(get_checkpoint_path(output_path)):
+        return set()
+    with open(get_checkpoint_path(output_path)) as checkpoint_file:
+        return set(line.strip() for line in checkpoint_file if line.strip())
+
+class RowWriter:
+    """
+    Appends rows to a CSV file, or to a JSON lines file if the path ends with .jsonl, flushing each row so it survives a crash
+    """
+    def __init__(self, path):
+        self.is_json = path.endswith('.jsonl')
+        is_new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.file = open(path, 'a', newline = '')
+        if not self.is_json:
+            self.writer = csv.DictWriter(self.file, fieldnames = SCREENER_FIELDS)
+            if is_new:
+                self.writer.writeheader()
+
+    def write(self, row):
+        if self.is_json:
+            self.file.write(json.dumps(row) + '\n')
+        else:
+            self.writer.writerow(row)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+def screen(my_tickers, output_path, filter_name = 'none', resume = True, on_fetch_failure = None):
+    """
+    Values the tickers and streams the rows passing the filter to the output, as soon as each ticker is valued.
+    Every processed ticker is appended to a checkpoint file next to the output, so an interrupted run resumes where it stopped
+    (unless resume is False, which starts over). Tickers whose data was fetched but cannot be valued are also checkpointed, so a resume does not
+    fetch them again, but tickers whose fetches failed (such as during an outage) are not, so a resume retries them.
+    Rows are not kept in memory, so any number of tickers can be screened.
+    INPUT:
+        my_tickers: iterable of tickers, such as read_tickers
+        output_path: CSV file, or JSON lines file if it ends with .jsonl
+        filter_name: one of FILTERS
+        on_fetch_failure: if given, called with each ticker whose fetches failed
+    OUTPUT:
+        (number of tickers valued in this run, number of rows written in this run)
+    """
+    if not resume:
+        for path in [output_path, get_checkpoint_path(output_path)]:
+            if os.path.exists(path):
+                os.remove(path)
+    processed = read_checkpoint(output_path)
+    row_filter = FILTERS[filter_name]
+    writer = RowWriter(output_path)
+    num_valued, num_written = 0, 0
+    try:
+        with open(get_checkpoint_path(output_path), 'a') as checkpoint_file:
+            def checkpoint(ticker):
+                checkpoint_file.write(ticker + '\n')
+                checkpoint_file.flush()
+            for record in iterate_valuations((ticker for ticker in my_tickers if ticker not in processed), on_failure = checkpoint,
+                    on_fetch_failure = on_fetch_failure):
+                price, valuations = record['ticker_data'].get('current_price'), record['valuations']
+                if price is not None and row_filter(price, valuations):
+                    writer.write(dict({'ticker': record['ticker'].upper(), 'current_price': round_values(price)},
+                        **{name: round_values(value) for name, value in valuations.items()}))
+                    num_written += 1
+                checkpoint(record['ticker'])
+                num_valued += 1
+    finally:
+        writer.close()
+    return num_valued, num_written
+
+if __name__ == '__main__':
+    args = argparse.ArgumentParser()
+    args.add_argument('--tickers-file', required = True, help = 'File with one ticker per line, such as all the Russell 3000 tickers')
+    args.add_argument('--output', required = True, help = 'CSV file to stream the rows to, or JSON lines file if it ends with .jsonl')
+    args.add_argument('--filter', default = 'none', choices = sorted(FILTERS), help = 'Write only the tickers whose current price is below the given valuation(s)')
+    args.add_argument('--restart', action = 'store_true', help = 'Start over, instead of resuming from the checkpoint of the output')
+    add_run_arguments(args, refresh = False)
+    namespace, extra_params = args.parse_known_args()
+    configure_run(namespace)
+
+    failed = []
+    num_valued, num_written = screen(read_tickers(namespace.tickers_file), namespace.output, namespace.filter, resume = not namespace.restart,
+        on_fetch_failure = failed.append)
+    print ("Valued %d tickers, wrote %d rows to %s" % (num_valued, num_written, namespace.output))
+    if failed:
+        print ("Cannot fetch %d tickers, run again to retry them" % len(failed))
+    finish_profile(namespace)
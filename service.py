@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+
+import tickers
+import argparse
+import datetime
+import json
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+from cache import expiry_time
+from cli import add_run_arguments, configure_run
+from constants import *
+from dividend_calendar import DividendCalendar, load_dividend_calendar
+from dividends import get_dividend_table, fetch_next_dividend
+from fetch_planner import FIELD_ENDPOINTS
+from ticker_data import TickerData
+from fetch_tickers import iterate_ticker_data, TICKER_DATA_FETCHERS
+from main import get_valuations
+from utils import *
+
+class ValuationService:
+    """
+    Long running service keeping the ticker_data and valuations of every ticker asked for in memory, and serving them as json at
+        GET /valuation/<ticker>
+        GET /dividends?days=N
+    Every field is refreshed in the background once its endpoint's TTL has expired (see CACHE_TTL_SECONDS), so requests are answered
+    from memory. Concurrent requests for a ticker not fetched yet wait for the same single fetch.
+    """
+    def __init__(self, my_tickers = (), dividend_tickers = (), dividend_calendar = None, refresh_interval_seconds = SERVICE_REFRESH_INTERVAL_SECONDS,
+            port = SERVICE_PORT):
+        self.my_tickers = list(my_tickers)
+        self.dividend_tickers = list(dividend_tickers)
+        self.dividend_calendar = dividend_calendar or DividendCalendar()
+        self.refresh_interval_seconds = refresh_interval_seconds
+        self.records = {} # ticker -> {ticker, fetched_at, ticker_data, valuations, expires_at: {(source, endpoint): time it expires}}
+        self.cold = {}    # ticker -> Future of its first fetch, while it is being fetched
+        self.lock = threading.Lock()
+        self.dividend_lock = threading.Lock()
+        self.stopped = threading.Event()
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                service.handle(self)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.server.daemon_threads = True
+        self.url = 'http://127.0.0.1:%d' % self.server.server_address[1]
+
+    def start(self):
+        threading.Thread(target = self.server.serve_forever, daemon = True).start()
+        threading.Thread(target = self.refresh_forever, daemon = True).start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def get_valuation(self, ticker):
+        """
+        Returns the record of the ticker, fetching it first if it was never asked for. Raises an exception if it cannot be valued.
+        """
+        with self.lock:
+            record = self.records.get(ticker)
+            future = self.cold.get(ticker)
+            first = record is None and future is None
+            if first:
+                future = self.cold[ticker] = Future()
+        if record is not None:
+            return record
+        if first:
+            try:
+                record = self.fetch_records([ticker], list(TICKER_DATA_FETCHERS))[ticker]
+                with self.lock:
+                    self.records[ticker] = record
+                future.set_result(record)
+            except Exception as exception:
+                future.set_exception(exception)
+            finally:
+                with self.lock:
+                    del self.cold[ticker]
+        return future.result()
+
+    def get_dividends(self, days = None):
+        """
+        Returns the upcoming dividends of the dividend tickers (see dividends.get_dividend_table), as a list of dictionaries
+        """
+        with self.dividend_lock:
+            rows = get_dividend_table(self.dividend_tickers, self.dividend_calendar, days)
+        return [dict(zip(['ticker', 'ex_dividend_date', 'days_to_dividend', 'expected_dividend'], row)) for row in rows]
+
+    def fetch_records(self, my_tickers, endpoints, previous_records = None):
+        """
+        Fetches the given endpoints for the tickers, and returns their new records, ticker -> record.
+        Fields missing from a new fetch keep their previous value, and the valuations are only computed again if a fundamental was fetched,
+        as they do not depend on the current price. A ticker which cannot be valued with its new data keeps its previous record,
+        so its endpoints are fetched again at the next refresh.
+        """
+        previous_records = previous_records or {}
+        records = {}
+        for ticker, fetched_data in iterate_ticker_data(my_tickers, endpoints):
+            previous = previous_records.get(ticker, {'ticker_data': {}, 'valuations': None, 'expires_at': {}})
+            now = time.time()
+            fetched_endpoints = set(FIELD_ENDPOINTS[field] for field in fetched_data)
+            ticker_data = TickerData(previous['ticker_data'])
+            ticker_data.update(fetched_data)
+            valuations = previous['valuations']
+            if valuations is None or fetched_endpoints - {(YAHOO, 'live_price')}:
+                try:
+                    valuations = get_valuations(ticker_data)
+                except:
+                    print ("Cannot value %s"%(ticker))
+                    continue
+            expires_at = dict(previous['expires_at'])
+            expires_at.update({endpoint: expiry_time(endpoint[1], now) for endpoint in fetched_endpoints})
+            records[ticker] = {'ticker': ticker, 'fetched_at': now, 'ticker_data': ticker_data, 'valuations': valuations, 'expires_at': expires_at}
+        missing = [ticker for ticker in my_tickers if ticker not in records and ticker not in previous_records]
+        if missing:
+            raise KeyError('Cannot fetch %s' % ', '.join(missing))
+        return records
+
+    def refresh(self):
+        """
+        Fetches again the expired endpoints of every known ticker, together for the tickers with the same expired endpoints
+        """
+        now = time.time()
+        with self.lock:
+            records = dict(self.records)
+        tickers_by_expired_endpoints = {}
+        for ticker, record in records.items():
+            expired_endpoints = tuple(endpoint for endpoint in TICKER_DATA_FETCHERS if record['expires_at'].get(endpoint, 0) <= now)
+            if expired_endpoints:
+                tickers_by_expired_endpoints.setdefault(expired_endpoints, []).append(ticker)
+        for expired_endpoints, my_tickers in tickers_by_expired_endpoints.items():
+            refreshed = self.fetch_records(my_tickers, list(expired_endpoints), records)
+            with self.lock:
+                self.records.update(refreshed)
+        with self.dividend_lock:
+            self.dividend_calendar.refresh(self.dividend_tickers, fetch_next_dividend, datetime.date.today())
+
+    def refresh_forever(self):
+        for ticker in self.my_tickers:
+            try:
+                self.get_valuation(ticker)
+            except:
+                print ("Cannot value %s"%(ticker))
+        while not self.stopped.wait(self.refresh_interval_seconds):
+            try:
+                self.refresh()
+            except:
+                print ("Cannot refresh the tickers")
+
+    def handle(self, request):
+        url = urlsplit(request.path)
+        path = url.path.strip('/').split('/')
+        try:
+            if len(path) == 2 and path[0] == 'valuation':
+                record = self.get_valuation(path[1].upper())
+                status, body = 200, {'ticker': record['ticker'], 'fetched_at': record['fetched_at'],
+                    'current_price': round_values(record['ticker_data'].get('current_price', 0)),
+                    'valuations': {name: round_values(value) for name, value in record['valuations'].items()},
+                    'ticker_data': dict(record['ticker_data'])}
+            elif path == ['dividends']:
+                days = parse_qs(url.query).get('days')
+                status, body = 200, self.get_dividends(int(days[0]) if days else None)
+            else:
+                status, body = 404, {'error': 'Unknown path %s' % url.path}
+        except Exception as exception:
+            status, body = 502, {'error': repr(exception)}
+        body = json.dumps(body, default = str).encode('utf-8')
+        request.send_response(status)
+        request.send_header('Content-Type', 'application/json')
+        request.send_header('Content-Length', str(len(body)))
+        request.end_headers()
+        request.wfile.write(body)
+
+if __name__ == '__main__':
+    args = argparse.ArgumentParser()
+    args.add_argument('--port', type = int, default = SERVICE_PORT, help = 'Local port to serve the json API at')
+    add_run_arguments(args, refresh = False, profile = False)
+    namespace, extra_params = args.parse_known_args()
+    configure_run(namespace)
+
+    #The tickers in tickers.py are fetched when the service starts, any other ticker when it is first asked for
+    dividend_calendar = DividendCalendar() if namespace.replay else load_dividend_calendar()
+    service = ValuationService(tickers.my_tickers, tickers.dividend_tickers, dividend_calendar, port = namespace.port)
+    print ("Serving at %s/valuation/<ticker> and %s/dividends?days=N" % (service.url, service.url))
+    service.start()
+    try:
+        while True:
+            time.sleep(SERVICE_REFRESH_INTERVAL_SECONDS)
+            if not namespace.replay:
+                with service.dividend_lock:
+                    dividend_calendar.save()
+    except KeyboardInterrupt:
+        service.stop()
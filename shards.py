@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+
+import argparse
+import csv
+import io
+import json
+import os
+import subprocess
+import sys
+import zlib
+from cli import add_run_arguments, configure_run
+from constants import *
+from rate_limiter import configure_rate_limit
+from screener import FILTERS, read_tickers, screen
+
+def get_shard(ticker, num_shards):
+    """
+    Returns the shard of the ticker, out of num_shards. The hash is stable, so a ticker is in the same shard in every process and on every host.
+    """
+    return zlib.crc32(ticker.upper().encode('utf-8')) % num_shards
+
+def shard_tickers(my_tickers, shard, num_shards):
+    """
+    Lazily yields the given tickers which are in the given shard
+    """
+    return (ticker for ticker in my_tickers if get_shard(ticker, num_shards) == shard)
+
+def get_shard_path(directory, shard, num_shards):
+    """
+    Returns the JSON lines file of the partial results of the shard. The screener keeps its checkpoint next to it, and it is marked done
+    by an empty file with .done appended, once all its tickers are processed.
+    """
+    return os.path.join(directory, 'shard-%03d-of-%03d.jsonl' % (shard, num_shards))
+
+def is_shard_done(directory, shard, num_shards):
+    return os.path.exists(get_shard_path(directory, shard, num_shards) + '.done')
+
+def run_shard(tickers_file, directory, shard, num_shards, filter_name = 'none', resume = True):
+    """
+    Screens the tickers of the shard (see screener.screen) into its partial results, resuming from its checkpoint, and marks it done
+    unless the fetches of some tickers failed, so that the shard is run again to retry them.
+    Runs in the current process, with its own rate limiters, see shards.py worker.
+    OUTPUT:
+        (number of tickers valued in this run, number of rows written in this run, number of tickers whose fetches failed)
+    """
+    os.makedirs(directory, exist_ok = True)
+    path = get_shard_path(directory, shard, num_shards)
+    if os.path.exists(path + '.done'):
+        os.remove(path + '.done')
+    failed = []
+    num_valued, num_written = screen(shard_tickers(read_tickers(tickers_file), shard, num_shards), path, filter_name, resume,
+        on_fetch_failure = failed.append)
+    if not failed:
+        open(path + '.done', 'w').close()
+    return num_valued, num_written, len(failed)
+
+def configure_rate_limit_share(num_workers):
+    """
+    Limits this process to its share of the rate limit of each source (see RATE_LIMITS_PER_HOST), when num_workers processes send from the same IP address
+    """
+    for host in SOURCE_HOSTS.values():
+        rate_per_second, capacity = RATE_LIMITS_PER_HOST.get(host, DEFAULT_RATE_LIMIT)
+        configure_rate_limit(host, rate_per_second / num_workers, max(1, capacity / num_workers))
+
+def run_shards(tickers_file, directory, num_shards, shards = None, worker_arguments = (), share_rate_limits = True):
+    """
+    Runs every given shard (by default all those not done yet) as its own worker process, all at the same time, and waits for them.
+    A failed shard can be run again on its own, it resumes from its checkpoint.
+    INPUT:
+        worker_arguments: further arguments of the workers, such as ['--replay', url] or ['--filter', 'below_min']
+        share_rate_limits: if the workers share the rate limit of each source, as they all send from this host. Otherwise each worker has
+            the whole rate limit, or the one given by --requests-per-second in worker_arguments
+    OUTPUT:
+        Dictionary of shard -> exit code of its worker, 0 if it succeeded
+    """
+    if shards is None:
+        shards = [shard for shard in range(num_shards) if not is_shard_done(directory, shard, num_shards)]
+    worker_arguments = list(worker_arguments)
+    if share_rate_limits and shards:
+        worker_arguments += ['--rate-limit-share', str(len(shards))]
+    workers = {shard: subprocess.Popen([sys.executable, os.path.abspath(__file__), 'worker', '--tickers-file', tickers_file, '--directory', directory,
+        '--shards', str(num_shards), '--shard', str(shard)] + worker_arguments) for shard in shards}
+    return {shard: worker.wait() for shard, worker in workers.items()}
+
+def merge(directory, num_shards):
+    """
+    Combines the partial results of all the shards, sorted by ticker.
+    OUTPUT:
+        (list of rows, as dictionaries of SCREENER_FIELDS, list of shards which are not done, whose rows may be missing)
+    """
+    rows = []
+    for shard in range(num_shards):
+        path = get_shard_path(directory, shard, num_shards)
+        if os.path.exists(path):
+            with open(path) as shard_file:
+                rows.extend(json.loads(line) for line in shard_file if line.strip())
+    rows.sort(key = lambda row: row['ticker'])
+    return rows, [shard for shard in range(num_shards) if not is_shard_done(directory, shard, num_shards)]
+
+def format_rows(rows, output_format):
+    """
+    Formats the merged rows as a table, CSV, or a JSON list
+    """
+    if output_format == 'json':
+        return json.dumps(rows, indent = 2)
+    if output_format == 'csv':
+        output = io.StringIO()
+        writer = csv.DictWriter(output, fieldnames = SCREENER_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+        return output.getvalue()
+    from tabulate import tabulate
+    return tabulate([[row[field] for field in SCREENER_FIELDS] for row in rows],
+        headers = [TICKER, CURRENT_PRICE] + [VALUATION_HEADERS[name] for name in VALUATION_NAMES])
+
+if __name__ == '__main__':
+    args = argparse.ArgumentParser()
+    args.add_argument('mode', choices = ['run', 'worker', 'merge'], help = 'run the shards as worker processes and merge their results, '
+        'run a single shard (such as on another host), or only merge the results of the shards')
+    args.add_argument('--tickers-file', help = 'File with one ticker per line, see screener.py. Required with run and worker')
+    args.add_argument('--directory', default = SHARD_DIRECTORY, help = 'Directory of the partial results, shared by all the shards')
+    args.add_argument('--shards', type = int, default = NUM_SHARDS, help = 'Number of shards the tickers are split into')
+    args.add_argument('--shard', type = int, help = 'With worker, the shard to run')
+    args.add_argument('--only', help = 'With run, the comma separated shards to run again, such as the failed ones, instead of all those not done')
+    args.add_argument('--filter', default = 'none', choices = sorted(FILTERS), help = 'Keep only the tickers whose current price is below the given valuation(s)')
+    args.add_argument('--restart', action = 'store_true', help = 'Start the shards over, instead of resuming from their checkpoints')
+    add_run_arguments(args, refresh = False, profile = False)
+    args.add_argument('--requests-per-second', type = float, help = 'Rate limit of each source for every worker, instead of RATE_LIMITS_PER_HOST. '
+        'Workers sharing an IP address should share its budget. With run, the workers share RATE_LIMITS_PER_HOST unless this is given')
+    args.add_argument('--rate-limit-share', type = int, help = 'With worker, the number of workers sending from this IP address, '
+        'which share RATE_LIMITS_PER_HOST. Set by run')
+    args.add_argument('--format', default = 'table', choices = ['table', 'csv', 'json'], help = 'Format of the merged results')
+    args.add_argument('--output', help = 'File to write the merged results to, instead of printing them')
+    namespace, extra_params = args.parse_known_args()
+    if namespace.mode in ['run', 'worker'] and not namespace.tickers_file:
+        args.error('--tickers-file is required with %s' % namespace.mode)
+    if namespace.mode == 'worker' and namespace.shard is None:
+        args.error('--shard is required with worker')
+
+    if namespace.mode == 'worker':
+        configure_run(namespace)
+        if namespace.requests_per_second:
+            for host in SOURCE_HOSTS.values():
+                configure_rate_limit(host, namespace.requests_per_second, namespace.requests_per_second)
+        elif namespace.rate_limit_share:
+            configure_rate_limit_share(namespace.rate_limit_share)
+        num_valued, num_written, num_failed = run_shard(namespace.tickers_file, namespace.directory, namespace.shard, namespace.shards,
+            namespace.filter, resume = not namespace.restart)
+        print ("Shard %d of %d: valued %d tickers, wrote %d rows" % (namespace.shard, namespace.shards, num_valued, num_written))
+        if num_failed:
+            print ("Shard %d of %d: cannot fetch %d tickers, run the shard again to retry them" % (namespace.shard, namespace.shards, num_failed))
+        #A shard with failed fetches is not done, and exits with an error so that run lists it
+        sys.exit(1 if num_failed else 0)
+
+    if namespace.mode == 'run':
+        worker_arguments = ['--filter', namespace.filter]
+        for flag, value in [('--restart', namespace.restart), ('--no-cache', namespace.no_cache)]:
+            if value:
+                worker_arguments.append(flag)
+        for option, value in [('--replay', namespace.replay), ('--requests-per-second', namespace.requests_per_second)]:
+            if value:
+                worker_arguments += [option, str(value)]
+        shards = [int(shard) for shard in namespace.only.split(',')] if namespace.only else None
+        if namespace.restart and shards is None:
+            shards = list(range(namespace.shards))
+        exit_codes = run_shards(namespace.tickers_file, namespace.directory, namespace.shards, shards, worker_arguments,
+            share_rate_limits = not namespace.requests_per_second)
+        failed = [shard for shard, exit_code in exit_codes.items() if exit_code != 0]
+        if failed:
+            print ("Shards %s failed, run them again with --only=%s" % (failed, ','.join(map(str, failed))))
+
+    rows, not_done = merge(namespace.directory, namespace.shards)
+    if not_done:
+        print ("Shards %s are not done, their results are missing or partial" % not_done, file = sys.stderr)
+    if namespace.output:
+        with open(namespace.output, 'w', newline = '') as output_file:
+            output_file.write(format_rows(rows, namespace.format))
+    else:
+        print (format_rows(rows, namespace.format))
@@ -0,0 +1,119 @@
+import datetime
+import os
+import time
+from constants import *
+from utils import *
+
+def write_snapshot(records, directory = SNAPSHOT_DIRECTORY):
+    """
+    Appends the given records to the snapshot store, as a new parquet file in the partition of today's date (date=YYYY-MM-DD).
+    Files are never modified, so every run can be compared with the previous ones.
+    INPUT:
+        records: list of dictionaries {ticker, fetched_at, ticker_data, valuations}, fetched_at in seconds since epoch
+    OUTPUT:
+        The path of the written file, or None if there were no records
+    """
+    if len(records) == 0:
+        return None
+    import pyarrow
+    import pyarrow.parquet
+    columns = {'ticker': [record['ticker'] for record in records], 'fetched_at': [record['fetched_at'] for record in records]}
+    for field in TICKER_DATA_FIELDS:
+        columns[field] = [record['ticker_data'].get(field) for record in records]
+    for name in VALUATION_NAMES:
+        columns[name] = [record['valuations'].get(name) for record in records]
+    schema = pyarrow.schema([('ticker', pyarrow.string())] + [(name, pyarrow.float64()) for name in list(columns)[1:]])
+    now = datetime.datetime.now()
+    partition = os.path.join(directory, 'date=' + now.strftime('%Y-%m-%d'))
+    os.makedirs(partition, exist_ok = True)
+    path = os.path.join(partition, 'run-%s-%d.parquet' % (now.strftime('%H%M%S%f'), os.getpid()))
+    pyarrow.parquet.write_table(pyarrow.Table.from_pydict(columns, schema = schema), path)
+    return path
+
+def load_latest_snapshot(my_tickers, directory = SNAPSHOT_DIRECTORY, max_age_seconds = None):
+    """
+    Returns the most recent record of each of the given tickers in the snapshot store, as a dictionary of ticker -> record
+    (see write_snapshot). Partitions are read from the newest, and only until every ticker is found. Tickers never stored are missing.
+    If max_age_seconds is given, the partitions of the days older than that are not read, so tickers never stored do not make
+    the whole store be read. Records older than max_age_seconds may still be returned from the partition of the oldest day read.
+    """
+    remaining = set(my_tickers)
+    latest = {}
+    if not os.path.isdir(directory):
+        return latest
+    import pyarrow.parquet
+    oldest_partition = None
+    if max_age_seconds is not None:
+        oldest_partition = 'date=' + datetime.datetime.fromtimestamp(time.time() - max_age_seconds).strftime('%Y-%m-%d')
+    for partition in sorted(os.listdir(directory), reverse = True):
+        if oldest_partition is not None and partition < oldest_partition:
+            break
+        partition_directory = os.path.join(directory, partition)
+        for file_name in sorted(os.listdir(partition_directory), reverse = True):
+            if not remaining:
+                return latest
+            table = pyarrow.parquet.read_table(os.path.join(partition_directory, file_name))
+            for row in table.to_pylist():
+                ticker = row['ticker']
+                if ticker in remaining and (ticker not in latest or row['fetched_at'] > latest[ticker]['fetched_at']):
+                    latest[ticker] = _to_record(row)
+            remaining.difference_update(latest)
+    return latest
+
+def iterate_snapshot_days(directory = SNAPSHOT_DIRECTORY):
+    """
+    Reads the whole snapshot store, and yields (date as a datetime.date, records) for every day of it, oldest first,
+    records being the latest record (see write_snapshot) of each ticker written that day, as a dictionary of ticker -> record
+    """
+    if not os.path.isdir(directory):
+        return
+    import pyarrow.parquet
+    for partition in sorted(os.listdir(directory)):
+        if not partition.startswith('date='):
+            continue
+        records = {}
+        partition_directory = os.path.join(directory, partition)
+        for file_name in sorted(os.listdir(partition_directory)):
+            for row in pyarrow.parquet.read_table(os.path.join(partition_directory, file_name)).to_pylist():
+                if row['ticker'] not in records or row['fetched_at'] > records[row['ticker']]['fetched_at']:
+                    records[row['ticker']] = _to_record(row)
+        yield datetime.datetime.strptime(partition[len('date='):], '%Y-%m-%d').date(), records
+
+def is_fresh(record, now = None):
+    """
+    Returns if the record was fetched less than SNAPSHOT_MAX_AGE_SECONDS ago
+    """
+    return record is not None and (now or time.time()) - record['fetched_at'] < SNAPSHOT_MAX_AGE_SECONDS
+
+def have_same_fundamentals(ticker_data, other_ticker_data):
+    """
+    Returns if the two ticker_data have the same values of all the fields the valuations depend on, that is all but the current price
+    """
+    return all(ticker_data.get(field) == other_ticker_data.get(field) for field in TICKER_DATA_FIELDS if field != 'current_price')
+
+def snapshot_diff(previous_snapshot, records):
+    """
+    Compares the valuations of the records with the previous snapshot.
+    Returns the rows to be printed, for every valuation which changed.
+    FORMAT:
+    [TICKER, Valuation, Previous, Current, Change%]
+    """
+    rows = []
+    for record in records:
+        previous = previous_snapshot.get(record['ticker'])
+        if previous is None:
+            continue
+        for name in VALUATION_NAMES:
+            previous_value, current_value = previous['valuations'].get(name), record['valuations'].get(name)
+            if previous_value != current_value and previous_value is not None and current_value is not None:
+                change = round_values((current_value - previous_value) / abs(previous_value) * 100) if previous_value else None
+                rows.append([record['ticker'].upper(), VALUATION_HEADERS[name], round_values(previous_value), round_values(current_value), change])
+    return rows
+
+def _to_record(row):
+    return {
+        'ticker': row['ticker'],
+        'fetched_at': row['fetched_at'],
+        'ticker_data': {field: row[field] for field in TICKER_DATA_FIELDS if row[field] is not None},
+        'valuations': {name: row[name] for name in VALUATION_NAMES if row[name] is not None},
+    }
@@ -0,0 +1,195 @@
+from cache import get_cached, get_fresh, set_cached
+from http_client import get_text, get_json
+from constants import *
+from rate_limiter import wait_for_host
+from profiler import profile_stage, record_bytes, record_cache
+from concurrent.futures import Future
+from contextlib import contextmanager
+import threading
+import json
+import os
+
+_settings = {'replay_url': None, 'recording_directory': None}
+_run = {'responses': None, 'endpoints': None}  # (source, endpoint, ticker) -> Future of its response, while fetch_once_per_run is active,
+                                               # and the (source, endpoint) whose responses are kept, or None for all of them
+_run_lock = threading.Lock()
+
+def configure_sources(replay_url = None, recording_directory = None):
+    """
+    Configures where the responses come from, for measuring and testing without the network (see replay.py).
+    INPUT:
+        replay_url: If given, every response is fetched from the stand-in server at this url, instead of the real sources.
+            Requests still wait for the rate limit of the real source's host.
+        recording_directory: If given, every response is also saved in this directory, as <source>/<endpoint>/<ticker>.json
+    """
+    _settings.update({'replay_url': replay_url, 'recording_directory': recording_directory})
+
+@contextmanager
+def fetch_once_per_run(endpoints = None):
+    """
+    Within this context, every source endpoint is fetched at most once per ticker, even without the cache and across commands run together
+    (such as the valuations and the dividends, see main.py --dividends). Concurrent requests for the same response wait for the first one,
+    and get its response or its exception.
+    The responses are kept in memory until the end of the context, so if endpoints is given, only the responses of these (source, endpoint)
+    are kept and fetched once, such as those read by more than one of the commands (see fetch_planner.get_shared_endpoints).
+    """
+    with _run_lock:
+        _run.update({'responses': {}, 'endpoints': None if endpoints is None else set(endpoints)})
+    try:
+        yield
+    finally:
+        with _run_lock:
+            _run.update({'responses': None, 'endpoints': None})
+
+def _get_run_responses(source, endpoint):
+    #Returns the responses kept by fetch_once_per_run if it keeps the given endpoint, otherwise None. Must be called with _run_lock held.
+    if _run['endpoints'] is not None and (source, endpoint) not in _run['endpoints']:
+        return None
+    return _run['responses']
+
+def fetch_source(source, endpoint, ticker):
+    """
+    Returns the raw response of the given source endpoint for the ticker. The response is read from the cache if it is still fresh,
+    otherwise it is fetched from the source, respecting the rate limit of its host, and cached (see CACHE_TTL_SECONDS in constants.py).
+    Raises an exception if the response cannot be fetched.
+    """
+    key = (source, endpoint, ticker)
+    with _run_lock:
+        responses = _get_run_responses(source, endpoint)
+        future = responses.get(key) if responses is not None else None
+        first = future is None
+        if responses is not None and first:
+            future = responses[key] = Future()
+    if responses is None:
+        return _fetch_source(source, endpoint, ticker)
+    if not first:
+        record_cache('source.%s.%s' % (source, endpoint), hit = True)
+        return future.result()
+    try:
+        future.set_result(_fetch_source(source, endpoint, ticker))
+    except Exception as exception:
+        future.set_exception(exception)
+    return future.result()
+
+def _fetch_source(source, endpoint, ticker):
+    fetch, host = SOURCE_ENDPOINTS[(source, endpoint)]
+    stage = 'source.%s.%s' % (source, endpoint)
+    fetched = []
+    def fetch_from_source():
+        fetched.append(True)
+        if _settings['replay_url'] is not None:
+            return get_json('%s/%s/%s/%s' % (_settings['replay_url'], source, endpoint, ticker), rate_limit_host = SOURCE_HOSTS[source])
+        if host is None:
+            return fetch(ticker)
+        wait_for_host(host)
+        value = fetch(ticker)
+        #yahoo_fin does not expose its responses, so the size of the parsed response (as cached) is counted instead of the bytes downloaded
+        record_bytes(stage, len(json.dumps(value)))
+        return value
+    with profile_stage(stage):
+        value = get_cached(source, endpoint, ticker, fetch_from_source)
+    record_cache(stage, hit = not fetched)
+    if _settings['recording_directory'] is not None:
+        save_recording(_settings['recording_directory'], source, endpoint, ticker, value)
+    return value
+
+def fetch_live_prices(my_tickers):
+    """
+    Returns {ticker: live price} for the given tickers (at most QUOTE_BATCH_SIZE of them), with a single quote request for all of them.
+    Prices still fresh in the cache are not quoted again, and the quoted prices are cached (and remembered by fetch_once_per_run)
+    as if fetched by fetch_source(YAHOO, 'live_price', ticker), so the other commands reuse them.
+    Tickers missing from the quotes are left out, to be fetched one by one with fetch_source. Raises an exception if the request fails.
+    """
+    stage = 'source.%s.quote' % YAHOO
+    prices = get_fresh(YAHOO, 'live_price', my_tickers)
+    for _ in prices:
+        record_cache(stage, hit = True)
+    missing = [ticker for ticker in my_tickers if ticker not in prices]
+    if not missing:
+        return prices
+    with profile_stage(stage):
+        if _settings['replay_url'] is not None:
+            url = '%s/%s/quote?symbols=%s' % (_settings['replay_url'], YAHOO, ','.join(missing))
+        else:
+            url = YAHOO_QUOTE_URL + ','.join(missing)
+        quotes = get_json(url, rate_limit_host = YAHOO_HOST)['quoteResponse']['result']
+    record_cache(stage, hit = False)
+    missing = set(missing)
+    for quote in quotes:
+        ticker, price = quote.get('symbol'), quote.get('regularMarketPrice')
+        if ticker not in missing or price is None:
+            continue
+        prices[ticker] = float(price)
+        set_cached(YAHOO, 'live_price', ticker, prices[ticker])
+        if _settings['recording_directory'] is not None:
+            save_recording(_settings['recording_directory'], YAHOO, 'live_price', ticker, prices[ticker])
+        with _run_lock:
+            responses = _get_run_responses(YAHOO, 'live_price')
+            if responses is not None and (YAHOO, 'live_price', ticker) not in responses:
+                future = responses[(YAHOO, 'live_price', ticker)] = Future()
+                future.set_result(prices[ticker])
+    return prices
+
+def get_recording_path(directory, source, endpoint, ticker):
+    return os.path.join(directory, source, endpoint, ticker + '.json')
+
+def save_recording(directory, source, endpoint, ticker, value):
+    """
+    Saves the response of the given source endpoint for the ticker in the recording directory
+    """
+    path = get_recording_path(directory, source, endpoint, ticker)
+    os.makedirs(os.path.dirname(path), exist_ok = True)
+    with open(path, 'w') as recording_file:
+        json.dump(value, recording_file)
+
+def load_recording(directory, source, endpoint, ticker):
+    """
+    Returns the recorded response of the given source endpoint for the ticker, or raises an exception if it was not recorded
+    """
+    with open(get_recording_path(directory, source, endpoint, ticker)) as recording_file:
+        return json.load(recording_file)
+
+#yahoo_fin (with pandas) is only imported when a response is fetched from yahoo, not for runs answered by the cache or the stand-in server
+def _fetch_yahoo_stats(ticker):
+    from yahoo_fin.stock_info import get_stats
+    stats_info = get_stats(ticker)
+    return dict(zip(stats_info['Attribute'], stats_info['Value']))
+
+def _fetch_yahoo_balance_sheet(ticker):
+    from yahoo_fin.stock_info import get_balance_sheet
+    #Only the most recent balance sheet is used
+    balance_sheet_info = get_balance_sheet(ticker)
+    return json.loads(balance_sheet_info[balance_sheet_info.columns[0]].to_json())
+
+def _fetch_yahoo_analysts_info(ticker):
+    from yahoo_fin.stock_info import get_analysts_info
+    return get_analysts_info(ticker)['Growth Estimates'].to_dict(orient = 'list')
+
+def _fetch_yahoo_live_price(ticker):
+    from yahoo_fin.stock_info import get_live_price
+    return float(get_live_price(ticker))
+
+def _fetch_morningstar_current_valuation(ticker):
+    return get_text('http://financials.morningstar.com/valuate/current-valuation-list.action?t=' + ticker)
+
+def _fetch_morningstar_finance_part(ticker):
+    return get_text('http://financials.morningstar.com/finan/financials/getFinancePart.html?t=' + ticker)
+
+def _fetch_morningstar_balance_sheet_report(ticker):
+    return get_json('http://financials.morningstar.com/ajax/ReportProcess4HtmlAjax.html?reportType=bs&t=' + ticker)['result']
+
+def _fetch_morningstar_key_stats(ticker):
+    return get_text('http://financials.morningstar.com/finan/financials/getKeyStatPart.html?t=' + ticker)
+
+#(source, endpoint) -> (function fetching the raw response for a ticker, host to wait for before fetching)
+#Endpoints fetched with http_client have no host here, as the client waits for the rate limit of the host before every attempt itself
+SOURCE_ENDPOINTS = {
+    (YAHOO, 'stats'): (_fetch_yahoo_stats, YAHOO_HOST),
+    (YAHOO, 'balance_sheet'): (_fetch_yahoo_balance_sheet, YAHOO_HOST),
+    (YAHOO, 'analysts_info'): (_fetch_yahoo_analysts_info, YAHOO_HOST),
+    (YAHOO, 'live_price'): (_fetch_yahoo_live_price, YAHOO_HOST),
+    (MORNINGSTAR, 'current_valuation'): (_fetch_morningstar_current_valuation, None),
+    (MORNINGSTAR, 'finance_part'): (_fetch_morningstar_finance_part, None),
+    (MORNINGSTAR, 'balance_sheet_report'): (_fetch_morningstar_balance_sheet_report, None),
+    (MORNINGSTAR, 'key_stats'): (_fetch_morningstar_key_stats, None),
+}
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+
+import tickers
+import argparse
+import json
+import math
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from tabulate import tabulate
+from batch_valuation import get_valuations_batch
+from fetch_planner import get_required_fields
+from constants import *
+from utils import *
+
+#The fields sweep_chunk needs: those of the valuation models, and the expected growth rate the sampled safety margins are applied to
+SWEEP_REQUIRED_FIELDS = get_required_fields(VALUATION_NAMES) + ['expected_growth_rate_future_in_percentage_5_years']
+
+def grid_sampling(points_per_parameter):
+    """
+    Sweeps over a grid of points_per_parameter evenly spaced values of every parameter in SWEEP_PARAMETER_RANGES
+    """
+    return {'method': 'grid', 'points_per_parameter': points_per_parameter}
+
+def random_sampling(num_samples, seed = 0):
+    """
+    Sweeps over num_samples random draws, every parameter uniformly distributed in its range in SWEEP_PARAMETER_RANGES
+    """
+    return {'method': 'random', 'num_samples': num_samples, 'seed': seed}
+
+def get_num_samples(sampling):
+    if sampling['method'] == 'grid':
+        return sampling['points_per_parameter'] ** len(SWEEP_PARAMETER_RANGES)
+    return sampling['num_samples']
+
+def get_parameter_chunk(sampling, chunk_index):
+    """
+    Returns a dictionary of parameter -> array of its values, for the samples in the given chunk of SWEEP_CHUNK_SIZE samples.
+    Chunks are computed independently, so each worker process can generate its own samples, instead of receiving them.
+    """
+    start = chunk_index * SWEEP_CHUNK_SIZE
+    end = min(start + SWEEP_CHUNK_SIZE, get_num_samples(sampling))
+    if sampling['method'] == 'grid':
+        points = sampling['points_per_parameter']
+        grid_indices = np.unravel_index(np.arange(start, end), (points,) * len(SWEEP_PARAMETER_RANGES))
+        return {name: np.linspace(low, high, points)[indices] for (name, (low, high)), indices in zip(SWEEP_PARAMETER_RANGES.items(), grid_indices)}
+    random_generator = np.random.default_rng([sampling['seed'], chunk_index])
+    return {name: random_generator.uniform(low, high, end - start) for name, (low, high) in SWEEP_PARAMETER_RANGES.items()}
+
+def sweep_chunk(ticker_data, sampling, chunk_index):
+    """
+    Values the ticker under every sample of the assumptions in the given chunk.
+    Returns a dictionary of valuation name -> array of valuations, one per sample.
+    """
+    parameters = get_parameter_chunk(sampling, chunk_index)
+    columns = dict(ticker_data)
+    columns['conservative_growth_rate'] = apply_margin_of_safety(ticker_data['expected_growth_rate_future_in_percentage_5_years'],
+        parameters['safety_margin_percentage'])
+    return get_valuations_batch(columns, parameters['discount_rate_in_percentage'], parameters['growth_decline_percentage'], parameters['fcf_multiplier'])
+
+def get_sweepable(ticker_data_by_ticker):
+    """
+    Returns the tickers which have all the SWEEP_REQUIRED_FIELDS, as a dictionary of ticker -> ticker_data.
+    The others are reported and skipped, as in main.iterate_valuations.
+    """
+    sweepable = {}
+    for ticker, ticker_data in ticker_data_by_ticker.items():
+        missing_fields = [field for field in SWEEP_REQUIRED_FIELDS if field not in ticker_data]
+        if len(ticker_data) > 0 and missing_fields:
+            print ("Cannot sweep %s, missing %s"%(ticker, ', '.join(missing_fields)))
+        elif len(ticker_data) > 0:
+            sweepable[ticker] = ticker_data
+    return sweepable
+
+def sweep(ticker_data_by_ticker, sampling, max_workers = None):
+    """
+    Values every ticker under all the samples of the assumptions, spread over a pool of max_workers processes.
+    Tickers missing some of the SWEEP_REQUIRED_FIELDS are skipped, see get_sweepable.
+    INPUT:
+        ticker_data_by_ticker: dictionary of ticker -> ticker_data, as returned by fetch_ticker_data
+        sampling: grid_sampling or random_sampling
+    OUTPUT:
+        Dictionary of ticker -> valuation name -> list of the SWEEP_PERCENTILES of its intrinsic values
+    """
+    ticker_data_by_ticker = get_sweepable(ticker_data_by_ticker)
+    num_chunks = math.ceil(get_num_samples(sampling) / SWEEP_CHUNK_SIZE)
+    tasks = [(ticker, chunk_index) for ticker in ticker_data_by_ticker for chunk_index in range(num_chunks)]
+    results = {}
+    with ProcessPoolExecutor(max_workers = max_workers) as executor:
+        chunk_valuations = executor.map(sweep_chunk, [ticker_data_by_ticker[ticker] for ticker, _ in tasks], [sampling] * len(tasks),
+            [chunk_index for _, chunk_index in tasks])
+        #Chunks come back in order, so all the chunks of a ticker are combined as soon as its last one is done
+        ticker_chunks = []
+        for (ticker, chunk_index), valuations in zip(tasks, chunk_valuations):
+            ticker_chunks.append(valuations)
+            if chunk_index == num_chunks - 1:
+                results[ticker] = {name: list(np.nanpercentile(np.concatenate([chunk[name] for chunk in ticker_chunks]), SWEEP_PERCENTILES))
+                    for name in valuations}
+                ticker_chunks = []
+    return results
+
+def prepare_to_print(ticker, percentiles):
+    """
+    prepares the rows of the given ticker's percentiles to be printed on screen.
+    FORMAT:
+    [TICKER, Valuation, Percentile_1, Percentile_2, ...]
+    """
+    return [[ticker.upper(), VALUATION_HEADERS[name]] + [round_values(value) for value in values] for name, values in percentiles.items()]
+
+if __name__ == '__main__':
+    args = argparse.ArgumentParser()
+    args.add_argument('--ticker', help = 'Run only for the given ticker')
+    args.add_argument('--input', help = 'JSON file of ticker -> ticker_data to sweep, instead of fetching it (the cache is used when fetching)')
+    args.add_argument('--grid', type = int, help = 'Sweep over a grid of the given number of values per assumption')
+    args.add_argument('--samples', type = int, default = 1000000, help = 'Number of random draws of the assumptions, when there is no --grid')
+    args.add_argument('--seed', type = int, default = 0, help = 'Seed of the random draws')
+    args.add_argument('--workers', type = int, help = 'Number of worker processes, by default the number of cores')
+    namespace, extra_params = args.parse_known_args()
+
+    if namespace.input:
+        with open(namespace.input) as input_file:
+            ticker_data_by_ticker = json.load(input_file)
+        if namespace.ticker:
+            ticker_data_by_ticker = {namespace.ticker: ticker_data_by_ticker[namespace.ticker]}
+    else:
+        from fetch_tickers import iterate_ticker_data
+        my_tickers = [namespace.ticker] if namespace.ticker else tickers.my_tickers
+        ticker_data_by_ticker = dict(iterate_ticker_data(my_tickers))
+
+    sampling = grid_sampling(namespace.grid) if namespace.grid else random_sampling(namespace.samples, namespace.seed)
+    percentiles = sweep(ticker_data_by_ticker, sampling, namespace.workers)
+    results = [row for ticker, ticker_percentiles in percentiles.items() for row in prepare_to_print(ticker, ticker_percentiles)]
+    print (tabulate(results, headers = [TICKER, VALUATION] + ['P%d' % percentile for percentile in SWEEP_PERCENTILES]))
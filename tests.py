@@ -1,5 +1,41 @@
 import unittest
+from unittest import mock
+import time
 from valuation_methods import *
+from batch_valuation import *
+from sweep import grid_sampling, get_parameter_chunk, sweep_chunk, sweep
+from backtest import write_backtest_data, load_backtest_data, backtest, snapshots_to_backtest_data, load_prices_csv
+from ticker_data import TickerData, TickerTable
+import numpy as np
+import random
+from rate_limiter import TokenBucket
+from extractors import extract_rows, extract_attribute_by_id
+import profiler
+from dividend_calendar import DividendCalendar, load_dividend_calendar
+from snapshots import write_snapshot, load_latest_snapshot, is_fresh, snapshot_diff
+from cache import configure_cache, get_cached, expiry_time
+import datetime
+import os
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import http_client
+import rate_limiter
+from replay import StandInServer, clone_recording
+import shutil
+import subprocess
+import sys
+import json
+from screener import screen, read_checkpoint
+from shards import get_shard, run_shard, run_shards, is_shard_done, merge, configure_rate_limit_share
+from sources import configure_sources, fetch_once_per_run
+from fetch_planner import get_shared_endpoints
+from fetch_tickers import fetch_ticker_data, iterate_ticker_data
+from main import get_valuation_table, iterate_valuations
+from dividends import get_dividend_table
+from service import ValuationService
+from watch import watch
+import urllib.request
 
 class TestValuationMethods(unittest.TestCase):
 
@@ -43,7 +79,492 @@ class TestValuationMethods(unittest.TestCase):
 
         self.assertEqual(round(roe_valuations, 2), 116.58)
 
+    def test_imports_with_standard_library_only(self):
+        #A fresh process, as the other tests import the heavy dependencies
+        code = 'import sys, valuation_methods; print(sorted(set(name.split(".")[0] for name in sys.modules) & {"numpy", "pandas", "requests", "yahoo_fin", "lxml", "bs4", "pyarrow"}))'
+        output = subprocess.run([sys.executable, '-c', code], cwd = os.path.dirname(os.path.abspath(__file__)), capture_output = True, text = True, check = True).stdout
+        self.assertEqual(output.strip(), '[]')
+
+class TestBatchValuation(unittest.TestCase):
+
+    def test_aapl_valuations(self):
+        columns = ticker_data_to_columns([dict(TestValuationMethods.aapl_ticker_data, total_debt = TestValuationMethods.aapl_ticker_data['total_liabilities'])])
+        valuations = get_valuations_batch(columns)
+        self.assertEqual(round(valuations['price_earnings_valuation'][0], 2), 170.02)
+        self.assertEqual(round(valuations['discounted_cash_flow_valuation'][0], 2), 185.34)
+        self.assertEqual(round(valuations['roe_valuation'][0], 2), 116.58)
+
+    def test_matches_scalar_valuations(self):
+        rng = random.Random(7)
+        ticker_data_list = [{field: rng.uniform(1, 50) for field in TestValuationMethods.aapl_ticker_data} for _ in range(200)]
+        for ticker_data in ticker_data_list:
+            ticker_data['total_debt'] = ticker_data['total_liabilities']
+        valuations = get_valuations_batch(ticker_data_to_columns(ticker_data_list))
+        for i, ticker_data in enumerate(ticker_data_list):
+            scalar_valuations = {
+                'price_earnings_valuation': price_earnings(ticker_data['earnings_per_share_ttm'], ticker_data['historical_price_earnings_ratio_5_years'],
+                    ticker_data['conservative_growth_rate'], 5),
+                'discounted_cash_flow_valuation': discounted_cash_flow(ticker_data['cash_and_cash_equivalents'], ticker_data['total_debt'],
+                    ticker_data['free_cash_flow_ttm'], ticker_data['shares_outstanding'], ticker_data['conservative_growth_rate'], 10),
+                'roe_valuation': roe_valuation(ticker_data['total_shareholders_equity'], ticker_data['roe_average_5_years'], ticker_data['shares_outstanding'],
+                    ticker_data['trailing_annual_dividend_rate'], ticker_data['conservative_growth_rate'], 10),
+            }
+            for name, value in scalar_valuations.items():
+                np.testing.assert_allclose(valuations[name][i], value, rtol = 1e-12)
+
+class TestTickerData(unittest.TestCase):
+
+    def test_record_is_used_like_a_dictionary(self):
+        ticker_data = TickerData(total_debt = 10.0, current_price = float('nan'))
+        ticker_data.validate()
+        self.assertEqual(ticker_data, {'total_debt': 10.0, 'current_price': 0})
+        self.assertEqual(ticker_data.get('shares_outstanding'), None)
+        self.assertIn('shares_outstanding', ticker_data.missing(['total_debt', 'shares_outstanding']))
+        with self.assertRaises(KeyError):
+            ticker_data['total_liabilities'] = 1
+        with self.assertRaises(KeyError):
+            TickerData({'total_debt': 10.0, 'total_liabilities': 1})
+
+    def test_table_columns_are_shared_with_batch_valuation(self):
+        ticker_data = dict(TestValuationMethods.aapl_ticker_data, total_debt = TestValuationMethods.aapl_ticker_data['total_liabilities'])
+        table = TickerTable()
+        table.append('AAPL', ticker_data)
+        table.append('NEW', {'current_price': 10.0})
+        columns = table.columns()
+        self.assertFalse(columns['total_debt'].flags['OWNDATA'])
+        self.assertEqual(list(table.missing_mask('total_debt')), [False, True])
+        valuations = get_valuations_batch(columns)
+        self.assertEqual(round(valuations['discounted_cash_flow_valuation'][0], 2), 185.34)
+        self.assertTrue(np.isnan(valuations['discounted_cash_flow_valuation'][1]))
+        del columns
+        self.assertEqual(table.get('NEW'), {'current_price': 10.0})
+
+class TestSweep(unittest.TestCase):
+
+    def test_samples_match_scalar_valuations(self):
+        ticker_data = dict(TestValuationMethods.aapl_ticker_data, total_debt = TestValuationMethods.aapl_ticker_data['total_liabilities'])
+        sampling = grid_sampling(3)
+        parameters = get_parameter_chunk(sampling, 0)
+        valuations = sweep_chunk(ticker_data, sampling, 0)
+        self.assertEqual(len(valuations['discounted_cash_flow_valuation']), 3 ** 4)
+        for i in [0, 40, 80]:
+            growth_rate = apply_margin_of_safety(ticker_data['expected_growth_rate_future_in_percentage_5_years'], parameters['safety_margin_percentage'][i])
+            dcf_valuation = discounted_cash_flow(ticker_data['cash_and_cash_equivalents'], ticker_data['total_debt'], ticker_data['free_cash_flow_ttm'],
+                ticker_data['shares_outstanding'], growth_rate, 10, parameters['discount_rate_in_percentage'][i], parameters['growth_decline_percentage'][i],
+                parameters['fcf_multiplier'][i])
+            self.assertAlmostEqual(valuations['discounted_cash_flow_valuation'][i], dcf_valuation, places = 9)
+
+    def test_skips_ticker_missing_fields(self):
+        ticker_data = dict(TestValuationMethods.aapl_ticker_data, total_debt = TestValuationMethods.aapl_ticker_data['total_liabilities'])
+        missing_ticker_data = dict(ticker_data)
+        del missing_ticker_data['shares_outstanding']
+        percentiles = sweep({'AAPL': ticker_data, 'BAD': missing_ticker_data, 'EMPTY': {}}, grid_sampling(2), max_workers = 1)
+        self.assertEqual(list(percentiles), ['AAPL'])
+
+class TestBacktest(unittest.TestCase):
+
+    def test_buys_below_valuation(self):
+        #A is valued at 185.34 by DCF and always bought, B at the same value but priced at 1000 is never bought
+        ticker_data = dict(TestValuationMethods.aapl_ticker_data, total_debt = TestValuationMethods.aapl_ticker_data['total_liabilities'])
+        fundamentals = {field: np.array([[ticker_data.get(field, 0)] * 2]) for field in BACKTEST_FUNDAMENTAL_FIELDS}
+        dates = np.arange('2020-01-01', '2020-01-07', dtype = 'datetime64[D]')
+        prices = np.array([[100, 1000], [110, 1000], [120, 1100], [130, 1100], [150, 1100], [150, 1100]])
+        with tempfile.TemporaryDirectory() as directory:
+            write_backtest_data(directory, ['A', 'B'], dates, prices, dates[:1], fundamentals)
+            rows = backtest(load_backtest_data(directory), rebalance_days = 2, holding_days = 2, chunk_dates = 1)
+        dcf_rows = [row for row in rows if row[1] == 'discounted_cash_flow_valuation']
+        self.assertEqual([(str(row[0]), row[2]) for row in dcf_rows], [('2020-01-01', 1), ('2020-01-03', 1)])
+        self.assertEqual([round(row[3], 4) for row in dcf_rows], [0.2, 0.25])
+        self.assertEqual([round(row[4], 4) for row in dcf_rows], [0.15, 0.125])
+
+    def test_converts_snapshots(self):
+        ticker_data = dict(TestValuationMethods.aapl_ticker_data, total_debt = 1.0, current_price = 100.0)
+        with tempfile.TemporaryDirectory() as directory:
+            snapshot_directory = os.path.join(directory, 'snapshots')
+            #A is stored on both days, B only on the first day, and keeps its fundamentals on the second day
+            for day, records in [('2020-01-01', {'A': 100.0, 'B': 50.0}), ('2020-01-02', {'A': 110.0})]:
+                write_snapshot([{'ticker': ticker, 'fetched_at': 0, 'ticker_data': dict(ticker_data, current_price = price), 'valuations': {}}
+                    for ticker, price in records.items()], snapshot_directory)
+                os.rename(os.path.join(snapshot_directory, 'date=' + datetime.date.today().strftime('%Y-%m-%d')),
+                    os.path.join(snapshot_directory, 'date=' + day))
+            backtest_directory = os.path.join(directory, 'backtest_data')
+            self.assertEqual(snapshots_to_backtest_data(backtest_directory, snapshot_directory), (2, 2))
+            data = load_backtest_data(backtest_directory)
+            self.assertEqual(data['tickers'], ['A', 'B'])
+            self.assertEqual([str(date) for date in data['fundamentals_dates']], ['2020-01-01', '2020-01-02'])
+            self.assertEqual(data['fundamentals']['total_debt'].tolist(), [[1.0, 1.0], [1.0, 1.0]])
+            self.assertTrue(np.array_equal(data['prices'], [[100.0, 50.0], [110.0, np.nan]], equal_nan = True))
+            #The daily prices can come from a CSV file instead
+            prices_path = os.path.join(directory, 'prices.csv')
+            with open(prices_path, 'w') as prices_file:
+                prices_file.write('date,ticker,close\n2020-01-01,A,99\n2020-01-02,A,101\n2020-01-03,A,102\n2020-01-03,B,51\n')
+            snapshots_to_backtest_data(backtest_directory, snapshot_directory, load_prices_csv(prices_path))
+            data = load_backtest_data(backtest_directory)
+            self.assertEqual(len(data['dates']), 3)
+            self.assertTrue(np.array_equal(data['prices'], [[99, np.nan], [101, np.nan], [102, 51]], equal_nan = True))
+
+class TestExtractors(unittest.TestCase):
+
+    def read_fixture(self, page):
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'morningstar', page + '.html'), encoding = 'utf-8') as page_file:
+            return page_file.read()
+
+    def test_extract_rows(self):
+        self.assertEqual(extract_rows(self.read_fixture('current_valuation'), ['Price/Earnings'])['Price/Earnings'][3], '15.4')
+        rows = extract_rows(self.read_fixture('key_stats'), ['Return on Equity %', 'Not a row'])
+        self.assertEqual(rows['Return on Equity %'][-2:], ['73.69', '—'])
+        self.assertNotIn('Not a row', rows)
+
+    def test_extract_attribute_by_id(self):
+        self.assertEqual(extract_attribute_by_id(self.read_fixture('balance_sheet_report'), 'data_i1', 'Y_5', 'rawvalue'), '48844000000')
+        self.assertRaises(KeyError, extract_attribute_by_id, self.read_fixture('balance_sheet_report'), 'data_i0', 'Y_5', 'rawvalue')
+
+class TestProfiler(unittest.TestCase):
+
+    def setUp(self):
+        profiler.reset_profile()
+        profiler.configure_profile()
+
+    def tearDown(self):
+        profiler.configure_profile(enabled = False)
+        profiler.reset_profile()
+
+    def test_stages_are_recorded(self):
+        price_earnings(11.89, 15.4, 7.395, 5)
+        with self.assertRaises(KeyError):
+            with profiler.profile_stage('fetch._get_stats'):
+                raise KeyError('Diluted EPS (ttm)')
+        profiler.record_cache('source.yahoo.stats', hit = True)
+        profile = profiler.get_profile()
+        self.assertEqual(profile['valuation.price_earnings']['calls'], 1)
+        self.assertEqual(profile['fetch._get_stats']['errors'], {'KeyError': 1})
+        self.assertEqual(profile['source.yahoo.stats']['cache_hits'], 1)
+        self.assertIn('value_investing_stage_failures_total{stage="fetch._get_stats",exception="KeyError"} 1', profiler.profile_to_prometheus())
+
+class TestSnapshots(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_latest_record_of_each_ticker(self):
+        ticker_data = dict(TestValuationMethods.aapl_ticker_data)
+        del ticker_data['total_liabilities']
+        fetched_at = time.time()
+        write_snapshot([{'ticker': 'AAPL', 'fetched_at': fetched_at - 100, 'ticker_data': ticker_data, 'valuations': {'roe_valuation': 110.0}},
+            {'ticker': 'INTC', 'fetched_at': fetched_at - 100, 'ticker_data': {}, 'valuations': {}}], self.directory.name)
+        write_snapshot([{'ticker': 'AAPL', 'fetched_at': fetched_at, 'ticker_data': ticker_data, 'valuations': {'roe_valuation': 116.58}}], self.directory.name)
+        snapshot = load_latest_snapshot(['AAPL', 'INTC', 'QCOM'], self.directory.name)
+        self.assertEqual(sorted(snapshot), ['AAPL', 'INTC'])
+        self.assertEqual(snapshot['AAPL']['ticker_data'], ticker_data)
+        self.assertEqual(snapshot['AAPL']['valuations'], {'roe_valuation': 116.58})
+        self.assertTrue(is_fresh(snapshot['AAPL']))
+        self.assertEqual(snapshot_diff({'AAPL': dict(snapshot['AAPL'], valuations = {'roe_valuation': 110.0})}, [snapshot['AAPL']]),
+            [['AAPL', ROE_VALUATION, 110.0, 116.58, 5.98]])
+        #Partitions of the days older than max_age_seconds are not read
+        os.rename(os.path.join(self.directory.name, 'date=' + datetime.date.today().strftime('%Y-%m-%d')), os.path.join(self.directory.name, 'date=2020-11-20'))
+        self.assertEqual(load_latest_snapshot(['AAPL'], self.directory.name, max_age_seconds = SNAPSHOT_MAX_AGE_SECONDS), {})
+        self.assertEqual(sorted(load_latest_snapshot(['AAPL'], self.directory.name)), ['AAPL'])
+
+class TestDividendCalendar(unittest.TestCase):
+
+    today = datetime.date(2020, 11, 20)
+
+    def fetch_next_dividend(self, ticker):
+        self.fetched.append(ticker)
+        if ticker == 'AMZN':
+            raise KeyError('Ex-Dividend Date 4')
+        return {'AAPL': (datetime.date(2020, 11, 6), 0.2), 'INTC': (datetime.date(2020, 11, 30), 0.33), 'QCOM': (datetime.date(2020, 12, 2), 0.65)}[ticker]
+
+    def test_queries_and_incremental_refresh(self):
+        self.fetched = []
+        dividend_calendar = DividendCalendar()
+        dividend_calendar.refresh(['AAPL', 'INTC', 'QCOM', 'AMZN'], self.fetch_next_dividend, self.today)
+        self.assertEqual(dividend_calendar.next_days(10, self.today), [(datetime.date(2020, 11, 30), 'INTC', 0.33)])
+        self.assertEqual([ticker for _, ticker, _ in dividend_calendar.this_month(self.today)], ['INTC'])
+        self.assertEqual([ticker for _, ticker, _ in dividend_calendar.between(self.today, None)], ['INTC', 'QCOM'])
+        self.assertEqual(dividend_calendar.by_ticker('QCOM'), (datetime.date(2020, 12, 2), 0.65))
+
+        with tempfile.TemporaryDirectory() as directory:
+            dividend_calendar.save(os.path.join(directory, 'calendar.json'))
+            dividend_calendar = load_dividend_calendar(os.path.join(directory, 'calendar.json'))
+        #Only the ticker whose ex-dividend date passed is fetched again the same day
+        self.fetched = []
+        dividend_calendar.refresh(['AAPL', 'INTC', 'QCOM', 'AMZN'], self.fetch_next_dividend, self.today)
+        self.assertEqual(self.fetched, ['AAPL'])
+        #The next day, the ticker without a known date is fetched again too
+        self.fetched = []
+        dividend_calendar.refresh(['AAPL', 'INTC', 'QCOM', 'AMZN'], self.fetch_next_dividend, self.today + datetime.timedelta(days = 1))
+        self.assertEqual(sorted(self.fetched), ['AAPL', 'AMZN'])
+
+class TestRateLimiter(unittest.TestCase):
+
+    def test_token_bucket_limits_rate(self):
+        bucket = TokenBucket(rate_per_second = 100, capacity = 2)
+        start = time.monotonic()
+        for _ in range(6):
+            bucket.acquire()
+        #The first 2 tokens are available right away, the other 4 are added at 100 per second
+        self.assertGreaterEqual(time.monotonic() - start, 0.035)
+
+
+class TestCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        configure_cache(path = os.path.join(self.directory.name, 'cache.sqlite3'))
+
+    def tearDown(self):
+        configure_cache()
+        self.directory.cleanup()
+
+    def test_fresh_responses_are_not_fetched_again(self):
+        calls = []
+        fetch = lambda: calls.append(1) or {'Diluted EPS (ttm)': '11.89'}
+        self.assertEqual(get_cached('yahoo', 'stats', 'AAPL', fetch), {'Diluted EPS (ttm)': '11.89'})
+        self.assertEqual(get_cached('yahoo', 'stats', 'AAPL', fetch), {'Diluted EPS (ttm)': '11.89'})
+        self.assertEqual(len(calls), 1)
+        configure_cache(refresh = True, path = os.path.join(self.directory.name, 'cache.sqlite3'))
+        get_cached('yahoo', 'stats', 'AAPL', fetch)
+        self.assertEqual(len(calls), 2)
+
+    def test_quarterly_data_expires_at_next_quarter(self):
+        fetched_at = datetime.datetime(2020, 11, 15).timestamp()
+        self.assertEqual(expiry_time('balance_sheet', fetched_at), datetime.datetime(2021, 1, 1).timestamp())
+        self.assertEqual(expiry_time('stats', fetched_at), fetched_at + 24 * 60 * 60)
+
+
+class TestHttpClient(unittest.TestCase):
+
+    class Handler(BaseHTTPRequestHandler):
+        statuses = []
+        received_headers = []
+
+        def do_GET(self):
+            self.received_headers.append(dict(self.headers))
+            status = self.statuses.pop(0)
+            self.send_response(status)
+            self.send_header('ETag', '"v1"')
+            self.end_headers()
+            if status == 200:
+                self.wfile.write(b'<table></table>')
+
+        def log_message(self, *args):
+            pass
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        configure_cache(path = os.path.join(self.directory.name, 'cache.sqlite3'))
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self.Handler)
+        threading.Thread(target = self.server.serve_forever, daemon = True).start()
+        for patcher in [mock.patch.dict(rate_limiter._buckets, {'127.0.0.1': TokenBucket(1000, 1000)}), mock.patch.object(http_client, 'HTTP_BACKOFF_SECONDS', 0.01)]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.url = 'http://127.0.0.1:%d/page' % self.server.server_address[1]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        configure_cache()
+        self.directory.cleanup()
+
+    def test_retries_and_conditional_requests(self):
+        self.Handler.statuses[:] = [503, 429, 200, 304]
+        self.assertEqual(http_client.get_text(self.url), '<table></table>')
+        #The page is not modified, so its previous content is returned
+        self.assertEqual(http_client.get_text(self.url), '<table></table>')
+        self.assertEqual(self.Handler.received_headers[-1]['If-None-Match'], '"v1"')
+        self.assertEqual(len(self.Handler.statuses), 0)
+
+
+class StandInTestCase(unittest.TestCase):
+    """
+    Serves a copy of the recordings in fixtures/recordings from a stand-in server, without the cache or the rate limits.
+    The recorded AAPL is also cloned to cloned_tickers, and the copy can be changed by the tests in self.recordings.
+    """
+    cloned_tickers = []
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.recordings = os.path.join(self.directory.name, 'recordings')
+        shutil.copytree(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'recordings'), self.recordings)
+        clone_recording(self.recordings, 'AAPL', self.cloned_tickers)
+        self.stand_in = StandInServer(self.recordings).start()
+        configure_cache(enabled = False)
+        configure_sources(replay_url = self.stand_in.url)
+        patcher = mock.patch.dict(rate_limiter._buckets, {host: TokenBucket(1000, 1000) for host in SOURCE_HOSTS.values()})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def set_upcoming_dividend(self, ticker, days = 30):
+        #The recorded ex-dividend date would eventually pass, so it is moved to the given number of days from today
+        stats_path = os.path.join(self.recordings, 'yahoo', 'stats', ticker + '.json')
+        with open(stats_path) as stats_file:
+            stats = json.load(stats_file)
+        ex_dividend_date = datetime.date.today() + datetime.timedelta(days = days)
+        with open(stats_path, 'w') as stats_file:
+            json.dump(dict(stats, **{'Ex-Dividend Date 4': ex_dividend_date.strftime('%b %d, %Y')}), stats_file)
+
+    def tearDown(self):
+        self.stand_in.stop()
+        configure_sources()
+        configure_cache()
+        self.directory.cleanup()
+
+
+class TestReplay(StandInTestCase):
+
+    def test_fetch_ticker_data_from_recording(self):
+        ticker_data = fetch_ticker_data('AAPL')
+        self.assertEqual(ticker_data['earnings_per_share_ttm'], 11.89)
+        self.assertEqual(ticker_data['conservative_growth_rate'], 7.395)
+        self.assertEqual(ticker_data['free_cash_flow_ttm'], 58245000000)
+        self.assertEqual(ticker_data['cash_and_cash_equivalents'], 48844000000)
+        self.assertEqual(ticker_data['roe_average_5_years'], 49.36)
+        self.assertEqual(self.stand_in.request_counts, {'yahoo': 4, 'morningstar': 4})
+
+    def test_planned_run_fetches_each_response_once(self):
+        self.set_upcoming_dividend('AAPL')
+        shared_endpoints = get_shared_endpoints([['discounted_cash_flow_valuation', 'current_price'], ['dividends']])
+        self.assertEqual(shared_endpoints, {('yahoo', 'stats')})
+        with fetch_once_per_run(shared_endpoints):
+            self.assertEqual(get_valuation_table(['AAPL'], ['discounted_cash_flow_valuation']), [['AAPL', 150, 215.33]])
+            self.assertEqual(len(get_dividend_table(['AAPL'])), 1)
+        #The dividends reuse the stats fetched for the DCF valuation, so only its 4 endpoints and the live price are fetched
+        self.assertEqual(self.stand_in.request_counts, {'yahoo': 3, 'morningstar': 2})
+
+    def test_live_prices_quoted_in_batch(self):
+        #AAPL is quoted in the batch, and only UNKNOWN, missing from the quotes, is then fetched on its own
+        prices = dict(iterate_ticker_data(['AAPL', 'UNKNOWN'], [('yahoo', 'live_price')]))
+        self.assertEqual(prices, {'AAPL': {'current_price': 150}, 'UNKNOWN': {}})
+        self.assertEqual(self.stand_in.request_counts, {'yahoo': 2})
+
+    def test_incremental_run_quotes_price_of_fresh_ticker(self):
+        previous = {'ticker': 'AAPL', 'fetched_at': time.time() - 100, 'ticker_data': {'current_price': 120.0}, 'valuations': {'roe_valuation': 110.0}}
+        records = list(iterate_valuations(['AAPL'], {'AAPL': previous}))
+        self.assertEqual(records, [dict(previous, ticker_data = {'current_price': 150}, refreshed = False)])
+        self.assertEqual(self.stand_in.request_counts, {'yahoo': 1})
+
+    def test_service_fetches_cold_ticker_once(self):
+        self.set_upcoming_dividend('AAPL')
+        service = ValuationService(dividend_tickers = ['AAPL'], refresh_interval_seconds = 3600, port = 0).start()
+        try:
+            threads = [threading.Thread(target = service.get_valuation, args = ('AAPL',)) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            with urllib.request.urlopen(service.url + '/valuation/aapl') as response:
+                valuation = json.loads(response.read())
+            self.assertEqual(valuation['current_price'], 150)
+            self.assertEqual(valuation['valuations']['discounted_cash_flow_valuation'], 215.33)
+            self.assertEqual(self.stand_in.request_counts, {'yahoo': 4, 'morningstar': 4})
+            with urllib.request.urlopen(service.url + '/dividends?days=365') as response:
+                self.assertEqual(json.loads(response.read())[0]['ticker'], 'AAPL')
+            #A ticker which cannot be valued after a refresh keeps its previous record
+            stats_path = os.path.join(self.recordings, 'yahoo', 'stats', 'AAPL.json')
+            with open(stats_path) as stats_file:
+                stats = json.load(stats_file)
+            with open(stats_path, 'w') as stats_file:
+                json.dump(dict(stats, **{'Shares Outstanding 5': 'N/A'}), stats_file)
+            record = service.get_valuation('AAPL')
+            record['expires_at'][('yahoo', 'stats')] = 0
+            service.refresh()
+            self.assertIs(service.get_valuation('AAPL'), record)
+        finally:
+            service.stop()
+
+
+class TestScreener(StandInTestCase):
+
+    cloned_tickers = ['AAPL1', 'AAPL2', 'AAPL3', 'BAD']
+
+    def test_resumes_from_checkpoint(self):
+        output = os.path.join(self.directory.name, 'screen.jsonl')
+        self.assertEqual(screen(['AAPL1', 'AAPL2'], output, 'below_pe'), (2, 2))
+        self.assertEqual(screen(['AAPL1', 'AAPL2', 'AAPL3'], output, 'below_pe'), (1, 1))
+        with open(output) as output_file:
+            self.assertEqual(sorted(json.loads(line)['ticker'] for line in output_file), ['AAPL1', 'AAPL2', 'AAPL3'])
+        #The current price of 150 is above the ROE valuation
+        self.assertEqual(screen(['AAPL1'], output, 'below_min', resume = False), (1, 0))
+
+    def test_skips_and_checkpoints_ticker_failing_valuation(self):
+        #With no shares outstanding, the DCF and ROE valuations divide by 0
+        stats_path = os.path.join(self.recordings, 'yahoo', 'stats', 'BAD.json')
+        with open(stats_path) as stats_file:
+            stats = json.load(stats_file)
+        with open(stats_path, 'w') as stats_file:
+            json.dump(dict(stats, **{'Shares Outstanding 5': 'N/A'}), stats_file)
+        output = os.path.join(self.directory.name, 'screen.jsonl')
+        self.assertEqual(screen(['AAPL1', 'BAD', 'AAPL2'], output), (2, 2))
+        requests = self.stand_in.request_counts.copy()
+        #The resume skips BAD, and only fetches AAPL3
+        self.assertEqual(screen(['AAPL1', 'BAD', 'AAPL2', 'AAPL3'], output), (1, 1))
+        self.assertEqual(self.stand_in.request_counts - requests, {'yahoo': 4, 'morningstar': 4})
+
+    def test_outage_is_not_checkpointed(self):
+        output = os.path.join(self.directory.name, 'screen.jsonl')
+        failed = []
+        #Nothing listens on port 1, so every fetch fails, and the tickers are left to the resume
+        configure_sources(replay_url = 'http://127.0.0.1:1')
+        with mock.patch.object(http_client, 'HTTP_BACKOFF_SECONDS', 0.01):
+            self.assertEqual(screen(['AAPL1', 'AAPL2'], output, on_fetch_failure = failed.append), (0, 0))
+        self.assertEqual((sorted(failed), read_checkpoint(output)), (['AAPL1', 'AAPL2'], set()))
+        configure_sources(replay_url = self.stand_in.url)
+        self.assertEqual(screen(['AAPL1', 'AAPL2'], output), (2, 2))
+
+    def test_shard_with_failed_fetches_is_not_done(self):
+        tickers_file = os.path.join(self.directory.name, 'tickers.txt')
+        with open(tickers_file, 'w') as tickers_file_handle:
+            tickers_file_handle.write('AAPL\n')
+        directory = os.path.join(self.directory.name, 'shards')
+        configure_sources(replay_url = 'http://127.0.0.1:1')
+        with mock.patch.object(http_client, 'HTTP_BACKOFF_SECONDS', 0.01):
+            self.assertEqual(run_shard(tickers_file, directory, 0, 2), (0, 0, 1))
+        self.assertEqual(merge(directory, 2)[1], [0, 1])
+        configure_sources(replay_url = self.stand_in.url)
+        self.assertEqual(run_shard(tickers_file, directory, 0, 2), (1, 1, 0))
+        self.assertTrue(is_shard_done(directory, 0, 2))
+
+    def test_sharded_run_merges_sorted_results(self):
+        tickers_file = os.path.join(self.directory.name, 'tickers.txt')
+        with open(tickers_file, 'w') as tickers_file_handle:
+            tickers_file_handle.write('AAPL3\nAAPL1\nAAPL2\nAAPL\n')
+        directory = os.path.join(self.directory.name, 'shards')
+        self.assertEqual([get_shard(ticker, 2) for ticker in ['AAPL', 'AAPL1', 'AAPL2', 'AAPL3']], [0, 1, 1, 1])
+        #The stand-in server is local, so the workers do not need to share the rate limits of the sources
+        self.assertEqual(run_shards(tickers_file, directory, 2, worker_arguments = ['--replay', self.stand_in.url, '--requests-per-second', '1000'],
+            share_rate_limits = False), {0: 0, 1: 0})
+        rows, not_done = merge(directory, 2)
+        self.assertEqual(([row['ticker'] for row in rows], not_done), (['AAPL', 'AAPL1', 'AAPL2', 'AAPL3'], []))
+        self.assertEqual(rows[0]['discounted_cash_flow_valuation'], 215.33)
+        #Done shards are not run again
+        self.assertEqual(run_shards(tickers_file, directory, 2), {})
+        #Workers run from the same host share the rate limit of each source
+        with mock.patch.dict(rate_limiter._buckets):
+            configure_rate_limit_share(4)
+            bucket = rate_limiter.get_rate_limiter(SOURCE_HOSTS['yahoo'])
+            self.assertEqual((bucket.rate_per_second, bucket.capacity), (0.5, 1))
+
+
+class TestWatch(StandInTestCase):
+
+    def test_polls_prices_and_emits_crossings(self):
+        #At 150, AAPL is 20.17% above its lowest valuation (ROE 124.82), so its margin of safety is above -30%
+        events = watch(['AAPL'], threshold = -30, price_interval_seconds = 0, ticks = 3)
+        event = next(events)
+        self.assertEqual((event['crossed'], round(event['margin_of_safety'], 2)), ('above', -20.17))
+        with open(os.path.join(self.recordings, 'yahoo', 'live_price', 'AAPL.json'), 'w') as price_file:
+            json.dump(200, price_file)
+        event = next(events)
+        self.assertEqual((event['crossed'], event['current_price']), ('below', 200))
+        self.assertEqual(list(events), [])
+        #The fundamentals are only fetched once, then only the price is quoted on every tick
+        self.assertEqual(self.stand_in.request_counts, {'yahoo': 6, 'morningstar': 4})
+
 
 
 if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+    unittest.main()
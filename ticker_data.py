@@ -0,0 +1,149 @@
+from array import array
+from collections.abc import MutableMapping
+from constants import *
+
+class TickerData(MutableMapping):
+    """
+    Record of the fields of a ticker (see TICKER_DATA_FIELDS), with a slot per field instead of a dictionary. A field is missing while its slot is not set.
+    It is used like the ticker_data dictionaries: ticker_data['total_debt'], ticker_data.get(field), field in ticker_data, dict(ticker_data).
+    Reading a field which is not set raises KeyError, as does setting a field which is not in TICKER_DATA_FIELDS.
+    The ticker_data yielded by fetch_tickers.iterate_ticker_data also has failed_endpoints, the list of (source, endpoint) which could not be fetched,
+    which is not a field.
+    """
+    __slots__ = tuple(TICKER_DATA_FIELDS) + ('failed_endpoints',)
+
+    def __init__(self, fields = (), **kwargs):
+        #The slots are set directly, without going through a dictionary and __setitem__, so a record is built as fast as a dictionary
+        field = None
+        try:
+            for field, value in (fields.items() if hasattr(fields, 'items') else fields):
+                setattr(self, field, value)
+            for field, value in kwargs.items():
+                setattr(self, field, value)
+        except (AttributeError, TypeError):
+            raise KeyError(field)
+
+    def __getitem__(self, field):
+        try:
+            return getattr(self, field)
+        except (AttributeError, TypeError):
+            raise KeyError(field)
+
+    def __setitem__(self, field, value):
+        if field not in _FIELDS:
+            raise KeyError(field)
+        try:
+            setattr(self, field, value)
+        except (AttributeError, TypeError):
+            raise KeyError(field)
+
+    def __delitem__(self, field):
+        try:
+            delattr(self, field)
+        except (AttributeError, TypeError):
+            raise KeyError(field)
+
+    def get(self, field, default = None):
+        return getattr(self, field, default) if field in _FIELDS else default
+
+    def __contains__(self, field):
+        return field in _FIELDS and hasattr(self, field)
+
+    def keys(self):
+        return [field for field in TICKER_DATA_FIELDS if hasattr(self, field)]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return 'TickerData(%r)' % dict(self)
+
+    def missing(self, fields = TICKER_DATA_FIELDS):
+        """
+        Returns the list of the given fields which are not set
+        """
+        return [field for field in fields if not hasattr(self, field)]
+
+    def validate(self):
+        """
+        Replaces every field set to nan with 0, as utils.validate_values does for dictionaries
+        """
+        for field in TICKER_DATA_FIELDS:
+            value = getattr(self, field, 0)
+            if value != value:
+                setattr(self, field, 0)
+
+_FIELDS = frozenset(TICKER_DATA_FIELDS)
+_NAN = float('nan')
+
+class TickerTable:
+    """
+    Struct-of-arrays table of the ticker_data of many tickers, such as a whole universe on a day of the backtest history
+    (see backtest.snapshots_to_backtest_data): a column of doubles per field
+    (see TICKER_DATA_FIELDS), and a missing mask per field with a byte per ticker, 1 if the field is not known (its value is then nan).
+    Values are not kept as a Python float object each, and columns() hands the whole columns to batch_valuation.get_valuations_batch
+    as NumPy arrays sharing the memory of the table, without copying.
+    The arrays returned by column, missing_mask and columns must be released before appending to the table, as it cannot grow
+    while its memory is shared.
+    """
+    def __init__(self):
+        self.tickers = []
+        self.rows = {} # ticker -> its row
+        self.values = {field: array('d') for field in TICKER_DATA_FIELDS}
+        self.missing = {field: bytearray() for field in TICKER_DATA_FIELDS}
+
+    def __len__(self):
+        return len(self.tickers)
+
+    def append(self, ticker, ticker_data):
+        """
+        Appends the ticker_data (a TickerData or dictionary) of the ticker as a new row
+        """
+        self.rows[ticker] = len(self.tickers)
+        self.tickers.append(ticker)
+        for field in TICKER_DATA_FIELDS:
+            value = ticker_data.get(field)
+            if value is None:
+                self.values[field].append(_NAN)
+                self.missing[field].append(1)
+            else:
+                self.values[field].append(value)
+                self.missing[field].append(0)
+
+    def get(self, ticker):
+        """
+        Returns the TickerData of the ticker, without its missing fields
+        """
+        row = self.rows[ticker]
+        return TickerData({field: self.values[field][row] for field in TICKER_DATA_FIELDS if not self.missing[field][row]})
+
+    def column(self, field):
+        """
+        Returns the values of the field for every ticker as a NumPy array sharing the memory of the table, nan where it is missing
+        """
+        import numpy as np
+        return np.frombuffer(self.values[field], dtype = float)
+
+    def missing_mask(self, field):
+        """
+        Returns a NumPy array of booleans sharing the memory of the table, True for the tickers whose field is missing
+        """
+        import numpy as np
+        return np.frombuffer(self.missing[field], dtype = bool)
+
+    def columns(self):
+        """
+        Returns the dictionary of field -> column for every field, as taken by batch_valuation.get_valuations_batch
+        """
+        return {field: self.column(field) for field in TICKER_DATA_FIELDS}
+
+    def validate(self):
+        """
+        Replaces every known value which is nan with 0, as utils.validate_values does for dictionaries. Missing values stay nan.
+        """
+        for field in TICKER_DATA_FIELDS:
+            values = self.column(field)
+            values[(values != values) & ~self.missing_mask(field)] = 0
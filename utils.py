@@ -1,5 +1,3 @@
-import requests
-from bs4 import BeautifulSoup
 from constants import *
 import math
 
@@ -31,28 +29,6 @@ def convert_abbreviated_strings_to_numbers(string):
     except:
         return 0
 
-def scrape_url_to_soup(url):
-    """
-    Scrapes the given url page and returns a beautifulSoup object of it
-    """
-    try:
-        session = requests.Session()
-        page = session.get(url)
-        return BeautifulSoup(page.content, 'lxml')
-    except:
-        print ("Cannot read from url = %s"%(url))
-
-def scrape_url_to_jsonsoup(url):
-    """
-    Scrapes the given url page which has a json response and returns a beautifulSoup object of it
-    """
-    try:
-        session = requests.Session()
-        page = session.get(url)
-        return BeautifulSoup(page.json()['result'], 'lxml')
-    except:
-        print ("Cannot read from url = %s"%(url))
-
 def round_values(data):
     """
     Rounds the given decimal values to ROUND_DECIMALS (defined in constants as 2) places
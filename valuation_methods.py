@@ -1,7 +1,10 @@
 from utils import *
 from constants import *
+from profiler import profiled
 
-def price_earnings(earnings_per_share_ttm, historical_price_earnings_ratio, expected_growth_rate_per_annum_in_percentage, num_years_forecast):
+@profiled('valuation.price_earnings')
+def price_earnings(earnings_per_share_ttm, historical_price_earnings_ratio, expected_growth_rate_per_annum_in_percentage, num_years_forecast,
+        discount_rate_in_percentage = HISTORIC_MARKET_DISCOUNT_RATE):
     """
     Calculates the estimate current valuation of the company, considering the price-earnings ratios.
     INPUT:
@@ -10,6 +13,7 @@ def price_earnings(earnings_per_share_ttm, historical_price_earnings_ratio, expe
         expected_growth_rate_per_annum_in_percentage per annum of the company. Of course this is an estimate, so its better to provide a conservative
             number with some margin of safety
         num_years_forecast of how long this above expected_growth_rate is predicted.
+        discount_rate_in_percentage: the rate used to bring future values to the present, by default the HISTORIC_MARKET_DISCOUNT_RATE
 
     OUTPUT:
         The net present value per share of the company
@@ -20,9 +24,11 @@ def price_earnings(earnings_per_share_ttm, historical_price_earnings_ratio, expe
     #Next we can calculate the future price of the share as EPS * P/E(historic) * growth
     future_predicted_price = earnings_per_share_ttm * historical_price_earnings_ratio * predicted_growth
     #Finally, we scale back the future price to the present day value, taking the historic market discount rate.
-    return net_present_value(future_predicted_price, HISTORIC_MARKET_DISCOUNT_RATE, num_years_forecast)
+    return net_present_value(future_predicted_price, discount_rate_in_percentage, num_years_forecast)
 
-def discounted_cash_flow(cash_and_cash_equivalents, total_debt, free_cash_flow, shares_outstanding, expected_growth_rate_per_annum_in_percentage, num_years_forecast):
+@profiled('valuation.discounted_cash_flow')
+def discounted_cash_flow(cash_and_cash_equivalents, total_debt, free_cash_flow, shares_outstanding, expected_growth_rate_per_annum_in_percentage, num_years_forecast,
+        discount_rate_in_percentage = HISTORIC_MARKET_DISCOUNT_RATE, growth_decline_percentage = GROWTH_DECLINE_PERCENTAGE, fcf_multiplier = FCF_MULTIPLIER_YEAR_10):
     """
     Calculates the valuation of the company using the discounted cash flow model.
     INPUT:
@@ -33,6 +39,9 @@ def discounted_cash_flow(cash_and_cash_equivalents, total_debt, free_cash_flow,
         expected_growth_rate_per_annum_in_percentage per annum of the company. Of course this is an estimate, so its better to provide a conservative
             number with some margin of safety
         num_years_forecast of how long this above expected_growth_rate is predicted.
+        discount_rate_in_percentage: the rate used to bring future values to the present, by default the HISTORIC_MARKET_DISCOUNT_RATE
+        growth_decline_percentage: the percentage by which the growth rate declines every year, by default GROWTH_DECLINE_PERCENTAGE
+        fcf_multiplier: the multiple of the last free cash flow the company is sold for, by default FCF_MULTIPLIER_YEAR_10
 
     OUTPUT:
         Per share value of the company, today, using the DCF model
@@ -42,19 +51,21 @@ def discounted_cash_flow(cash_and_cash_equivalents, total_debt, free_cash_flow,
         #Calculate the free cash flow for the next year
         free_cash_flow = free_cash_flow * cumulative_growth_rate(expected_growth_rate_per_annum_in_percentage, 1)
         #Take the net present value of the fcf
-        npv_fcf = net_present_value(free_cash_flow, HISTORIC_MARKET_DISCOUNT_RATE, i + 1)
+        npv_fcf = net_present_value(free_cash_flow, discount_rate_in_percentage, i + 1)
         total_npv_fcf += npv_fcf
         # Reduce the growth rate of the company, as the company grows older, growth usually declines
-        expected_growth_rate_per_annum_in_percentage = apply_margin_of_safety(expected_growth_rate_per_annum_in_percentage, GROWTH_DECLINE_PERCENTAGE)
+        expected_growth_rate_per_annum_in_percentage = apply_margin_of_safety(expected_growth_rate_per_annum_in_percentage, growth_decline_percentage)
     #Take the last fcf values npv, and multiply by a constant. This constant represents the company is being sold.
-    fcf_value_year_10 = npv_fcf * FCF_MULTIPLIER_YEAR_10
+    fcf_value_year_10 = npv_fcf * fcf_multiplier
     #Calculate the net company value taking all the npvs of cash, current cash and cash equivalents, and the price of selling. Minus the total_debt
     company_value = total_npv_fcf + fcf_value_year_10 + cash_and_cash_equivalents - total_debt
     # Calculate the per share value from the total company value
     per_share_value = company_value / shares_outstanding
     return per_share_value
 
-def roe_valuation(total_shareholders_equity, roe_average_5_years, shares_outstanding, trailing_annual_dividend_rate, expected_growth_rate_per_annum_in_percentage, num_years_forecast):
+@profiled('valuation.roe_valuation')
+def roe_valuation(total_shareholders_equity, roe_average_5_years, shares_outstanding, trailing_annual_dividend_rate, expected_growth_rate_per_annum_in_percentage, num_years_forecast,
+        discount_rate_in_percentage = HISTORIC_MARKET_DISCOUNT_RATE):
     """
     Calculates the ROE valuation of the company taking the historic average values and the dividends it pays. 
     Assumptions, company is on average able to maintain its profitability, and gives out some dividends to its shareholders.
@@ -67,6 +78,8 @@ def roe_valuation(total_shareholders_equity, roe_average_5_years, shares_outstan
         expected_growth_rate_per_annum_in_percentage per annum of the company. Of course this is an estimate, so its better to provide a conservative
             number with some margin of safety
         num_years_forecast of how long this above expected_growth_rate is predicted.
+        discount_rate_in_percentage: the rate used to bring future values to the present, and the return the company is required
+            to earn, by default the HISTORIC_MARKET_DISCOUNT_RATE
     """
     trailing_annual_dividend_rate = trailing_annual_dividend_rate or 0
     #Amount of equity for each share
@@ -78,12 +91,12 @@ def roe_valuation(total_shareholders_equity, roe_average_5_years, shares_outstan
         #Increase dividend by expected growth
         trailing_annual_dividend_rate = trailing_annual_dividend_rate * cumulative_growth_rate(expected_growth_rate_per_annum_in_percentage, 1)
         #Take net present value of the dividend
-        npv_dividend = net_present_value(trailing_annual_dividend_rate, HISTORIC_MARKET_DISCOUNT_RATE, i)
+        npv_dividend = net_present_value(trailing_annual_dividend_rate, discount_rate_in_percentage, i)
         total_npv_dividend += npv_dividend
     #Sell the company after the mentioned number of years, so the net income per share is the amount of money each share will be able to generate
     net_income_last_year = shareholders_equity_per_share * roe_average_5_years / 100
     # Required value os the amount of shareholders equity that would be required if company merely earned the historic market returns
-    required_value = net_income_last_year / (HISTORIC_MARKET_DISCOUNT_RATE / 100)
+    required_value = net_income_last_year / (discount_rate_in_percentage / 100)
     # Take the net present value of that
-    npv_required_value = net_present_value(required_value, HISTORIC_MARKET_DISCOUNT_RATE, 10)
+    npv_required_value = net_present_value(required_value, discount_rate_in_percentage, 10)
     return npv_required_value + total_npv_dividend
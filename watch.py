@@ -0,0 +1,81 @@
+import time
+from constants import *
+from fetch_tickers import iterate_ticker_data
+from utils import *
+
+def get_price_metrics(current_price, valuations):
+    """
+    Computes the outputs of a ticker which depend on its current price, from its valuations, which do not.
+    FORMAT:
+    {
+        discount_to_<valuation name>: percentage by which the current price is below the valuation, negative if it is above,
+        margin_of_safety: the smallest of the discounts, so the price is below all the valuations by at least this percentage
+    }
+    Valuations which are not positive have no discount, and margin_of_safety is None if no valuation is positive.
+    """
+    metrics = {}
+    for valuation_name, valuation in valuations.items():
+        if valuation > 0:
+            metrics['discount_to_' + valuation_name] = (valuation - current_price) / valuation * 100
+    metrics['margin_of_safety'] = min(metrics.values()) if metrics else None
+    return metrics
+
+def get_crossing_event(ticker, current_price, previous_metrics, metrics, threshold):
+    """
+    Returns the event of the ticker if its margin of safety crossed the threshold since previous_metrics, otherwise None.
+    A ticker with no previous_metrics is taken as being below the threshold, so it emits an event on its first tick if it is above.
+    FORMAT:
+    {ticker, crossed ('above' or 'below'), margin_of_safety, current_price, threshold, time}
+    """
+    def is_above(ticker_metrics):
+        return ticker_metrics is not None and ticker_metrics['margin_of_safety'] is not None and ticker_metrics['margin_of_safety'] >= threshold
+    if is_above(previous_metrics) == is_above(metrics):
+        return None
+    return {'ticker': ticker, 'crossed': 'above' if is_above(metrics) else 'below', 'margin_of_safety': metrics['margin_of_safety'],
+        'current_price': current_price, 'threshold': threshold, 'time': time.time()}
+
+def format_event(event):
+    return '%s %s margin of safety %s%% crossed %s %s%% at price %s' % (time.strftime('%H:%M:%S', time.localtime(event['time'])),
+        event['ticker'].upper(), round_values(event['margin_of_safety'] or 0), event['crossed'], event['threshold'], round_values(event['current_price']))
+
+def watch(my_tickers, threshold = WATCH_MARGIN_OF_SAFETY_THRESHOLD, price_interval_seconds = WATCH_PRICE_INTERVAL_SECONDS,
+        fundamentals_interval_seconds = WATCH_FUNDAMENTALS_INTERVAL_SECONDS, ticks = None):
+    """
+    Watches the given tickers, and yields an event (see get_crossing_event) whenever the margin of safety of a ticker crosses the threshold.
+    The tickers are valued once every fundamentals_interval_seconds (see main.iterate_valuations). In between, only their prices are polled
+    every price_interval_seconds, quoted in batches (see fetch_tickers.iterate_ticker_data), and only the price dependent outputs
+    (see get_price_metrics) of the tickers whose price changed are computed again.
+    ticks: number of price polls to run, forever by default
+    """
+    #Imported here, as main.py imports this module for --watch
+    from main import iterate_valuations
+    valuations = {}    # ticker -> valuations, as of the last fundamentals refresh
+    prices = {}        # ticker -> last current price
+    metrics = {}       # ticker -> last price metrics
+    valued_at = None
+    tick = 0
+    while ticks is None or tick < ticks:
+        started_at = time.time()
+        if valued_at is None or started_at - valued_at >= fundamentals_interval_seconds:
+            new_prices = {}
+            for record in iterate_valuations(my_tickers):
+                valuations[record['ticker']] = record['valuations']
+                new_prices[record['ticker']] = record['ticker_data']['current_price']
+            #Every ticker is compared again, as its valuations may have changed
+            prices = {}
+            valued_at = started_at
+        else:
+            new_prices = {ticker: ticker_data['current_price'] for ticker, ticker_data
+                in iterate_ticker_data(list(valuations), [(YAHOO, 'live_price')]) if 'current_price' in ticker_data}
+        for ticker, current_price in new_prices.items():
+            if prices.get(ticker) == current_price:
+                continue
+            prices[ticker] = current_price
+            ticker_metrics = get_price_metrics(current_price, valuations[ticker])
+            event = get_crossing_event(ticker, current_price, metrics.get(ticker), ticker_metrics, threshold)
+            metrics[ticker] = ticker_metrics
+            if event is not None:
+                yield event
+        tick += 1
+        if ticks is None or tick < ticks:
+            time.sleep(max(0, price_interval_seconds - (time.time() - started_at)))